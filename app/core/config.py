@@ -23,6 +23,8 @@ class Settings(BaseSettings):
     MAX_TOKENS: int = 4096
     TEMPERATURE: float = 0.7
     AI_TIMEOUT: int = 30  # AI 请求超时时间（秒）
+    AI_MAX_CONNECTIONS: int = 64  # AI 服务 HTTP 连接池大小
+    AI_MAX_KEEPALIVE_CONNECTIONS: int = 32
 
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./ecommerce.db"
@@ -32,6 +34,9 @@ class Settings(BaseSettings):
     # Redis 配置
     REDIS_URL: str = "redis://localhost:6379/0"
     REDIS_MAX_CONNECTIONS: int = 10
+    # 连接/读写超时（秒）：Redis 不可达时尽快失败，由调用方降级，避免每个请求都卡住
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 0.2
+    REDIS_SOCKET_TIMEOUT: float = 0.2
 
     # 缓存配置
     CACHE_TTL: int = 3600  # 1小时
@@ -49,6 +54,7 @@ class Settings(BaseSettings):
     RATE_LIMIT_ENABLED: bool = True
     RATE_LIMIT_REQUESTS: int = 100  # 每分钟最大请求数
     RATE_LIMIT_WINDOW: int = 60  # 时间窗口（秒）
+    RATE_LIMIT_BACKEND: str = "memory"  # memory（单进程）, redis（多 worker 共享）
 
     # 日志配置
     LOG_LEVEL: str = "INFO"
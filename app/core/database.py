@@ -1,26 +1,38 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Index
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, Text, Index, Enum, DDL, event, func, text
+)
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from app.core.config import settings
-from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _async_url(url: str) -> str:
+    """将同步驱动的连接串转换为对应的异步驱动"""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+DATABASE_URL = _async_url(settings.DATABASE_URL)
+
 # 数据库引擎配置
 engine_kwargs = {
     "echo": settings.DEBUG,
-    "future": True,
 }
 
-# SQLite 特殊配置
-if "sqlite" in settings.DATABASE_URL:
-    engine_kwargs["connect_args"] = {"check_same_thread": False}
+if ":memory:" in DATABASE_URL or DATABASE_URL.endswith("sqlite+aiosqlite://"):
+    # 内存 SQLite：所有会话共享同一个连接，否则每个连接都是一个空数据库
+    engine_kwargs["poolclass"] = StaticPool
 else:
-    # PostgreSQL/MySQL 连接池配置
+    # 连接池配置（文件 SQLite 同样受益于连接复用）
     engine_kwargs.update({
-        "poolclass": QueuePool,
+        "poolclass": AsyncAdaptedQueuePool,
         "pool_size": settings.DATABASE_POOL_SIZE,
         "max_overflow": settings.DATABASE_MAX_OVERFLOW,
         "pool_pre_ping": True,  # 连接前检查
@@ -28,9 +40,14 @@ else:
     })
 
 # 创建数据库引擎
-engine = create_engine(settings.DATABASE_URL, **engine_kwargs)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(DATABASE_URL, **engine_kwargs)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -48,16 +65,36 @@ class Product(Base):
     rating = Column(Float, default=0.0)
     reviews_count = Column(Integer, default=0)
     stock = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 复合索引
     __table_args__ = (
         Index('idx_category_price', 'category', 'price'),
         Index('idx_rating_reviews', 'rating', 'reviews_count'),
+        # 热门商品：只索引有库存的商品，并覆盖列表所需字段，支持仅索引扫描
+        Index(
+            'idx_trending', 'rating', 'reviews_count', 'id', 'name', 'price',
+            postgresql_where=text('stock > 0'),
+            sqlite_where=text('stock > 0'),
+        ),
+        # 关键词模糊搜索（pg_trgm 三元组索引，仅 PostgreSQL）
+        Index(
+            'idx_name_trgm', 'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+        ).ddl_if(dialect='postgresql'),
     )
 
 
+# 三元组索引依赖 pg_trgm 扩展
+event.listen(
+    Product.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+
 class Order(Base):
     """订单表"""
     __tablename__ = "orders"
@@ -68,8 +105,8 @@ class Order(Base):
     quantity = Column(Integer)
     total_price = Column(Float)
     status = Column(String)  # pending, paid, shipped, delivered, cancelled
-    created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 class User(Base):
@@ -80,7 +117,7 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     phone = Column(String)
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
 class ChatHistory(Base):
@@ -90,10 +127,13 @@ class ChatHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String, index=True, nullable=False)
     user_id = Column(String, index=True, nullable=True)
-    role = Column(String, nullable=False)  # user or assistant
+    role = Column(
+        Enum("user", "assistant", name="chat_role", native_enum=False, create_constraint=True),
+        nullable=False
+    )
     content = Column(Text, nullable=False)
     intent = Column(String)  # 用户意图
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     __table_args__ = (
         Index('idx_session_created', 'session_id', 'created_at'),
@@ -101,10 +141,11 @@ class ChatHistory(Base):
 
 
 # 创建所有表
-def init_db():
+async def init_db():
     """初始化数据库"""
     try:
-        Base.metadata.create_all(bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
         logger.info("数据库初始化成功")
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
@@ -112,24 +153,22 @@ def init_db():
 
 
 # 获取数据库会话
-def get_db():
+async def get_db():
     """获取数据库会话（依赖注入）"""
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception as e:
-        logger.error(f"数据库会话错误: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"数据库会话错误: {e}")
+            await db.rollback()
+            raise
 
 
 # 关闭数据库连接
-def close_db():
+async def close_db():
     """关闭数据库连接"""
     try:
-        engine.dispose()
+        await engine.dispose()
         logger.info("数据库连接已关闭")
     except Exception as e:
-        logger.error(f"关闭数据库连接失败: {e}")
\ No newline at end of file
+        logger.error(f"关闭数据库连接失败: {e}")
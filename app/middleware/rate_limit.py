@@ -1,40 +1,86 @@
 """限流中间件"""
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Tuple
+from fastapi import status
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from redis.exceptions import RedisError
 from app.utils.rate_limiter import rate_limiter
+from app.utils.rate_limiter_lua import redis_rate_limiter
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 热路径上使用的配置项在导入时缓存为模块常量，避免每个请求都访问 settings
+_ENABLED = settings.RATE_LIMIT_ENABLED
+_BACKEND = settings.RATE_LIMIT_BACKEND
+_LIMIT = str(settings.RATE_LIMIT_REQUESTS)
+
+# 不限流的路径（健康检查、文档）
+_SKIP_PATHS = frozenset({"/health", "/docs", "/redoc", "/openapi.json"})
+
+
+def reload_settings():
+    """重新读取限流配置（运行时修改 settings 后调用，如测试中）"""
+    global _ENABLED, _BACKEND, _LIMIT
+    _ENABLED = settings.RATE_LIMIT_ENABLED
+    _BACKEND = settings.RATE_LIMIT_BACKEND
+    _LIMIT = str(settings.RATE_LIMIT_REQUESTS)
+
+
+async def _check_rate_limit(client_ip: str) -> Tuple[bool, int]:
+    """检查限流，返回 (是否允许, 剩余次数)"""
+    if _BACKEND == "redis":
+        try:
+            return await redis_rate_limiter.check_and_remaining(client_ip)
+        except RedisError as e:
+            # Redis 不可用时降级为进程内限流，避免整个服务不可用
+            logger.warning("Redis 限流不可用，降级为内存限流: %s", e)
+
+    return rate_limiter.check_and_remaining(client_ip)
+
+
+class RateLimitMiddleware:
+    """
+    全局限流中间件（纯 ASGI 实现）
+
+    不继承 BaseHTTPMiddleware，避免其为每个请求创建任务组和包装请求/响应流的开销
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # 非 HTTP 请求、未启用限流或跳过的路径，直接通过
+        if scope["type"] != "http" or not _ENABLED or scope["path"] in _SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """全局限流中间件"""
-    
-    async def dispatch(self, request: Request, call_next):
-        # 跳过健康检查和文档路径
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
-        
-        # 如果未启用限流，直接通过
-        if not settings.RATE_LIMIT_ENABLED:
-            return await call_next(request)
-        
         # 获取客户端标识（IP 地址）
-        client_ip = request.client.host if request.client else "unknown"
-        
-        # 检查限流
-        if not rate_limiter.is_allowed(client_ip):
-            logger.warning(f"限流触发: {client_ip} - {request.url.path}")
-            raise HTTPException(
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        # 检查限流（同时拿到剩余次数，Redis 模式下只需一次往返）
+        allowed, remaining = await _check_rate_limit(client_ip)
+        if not allowed:
+            logger.warning("限流触发: %s - %s", client_ip, scope["path"])
+            response = JSONResponse(
+                {"detail": "请求过于频繁，请稍后再试"},
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="请求过于频繁，请稍后再试"
+                headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Limit": _LIMIT}
             )
-        
-        # 添加限流信息到响应头
-        response = await call_next(request)
-        remaining = rate_limiter.get_remaining(client_ip)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Limit"] = str(settings.RATE_LIMIT_REQUESTS)
-        
-        return response
+            await response(scope, receive, send)
+            return
+
+        remaining_header = str(remaining)
+
+        async def send_with_headers(message: Message):
+            # 添加限流信息到响应头
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-RateLimit-Remaining", remaining_header)
+                headers.append("X-RateLimit-Limit", _LIMIT)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional, Dict, AsyncGenerator
 import logging
-import json
+import time
+import orjson
 
-from app.services.copilot_client import CopilotClient
-from app.services.session_manager import SessionManager
+from app.core.config import settings
+from app.services.copilot_client import get_copilot
+from app.services.session_manager import SessionManager, get_session_manager
 from app.services.intent_classifier import IntentClassifier
+from app.services.chat_writer import chat_writer
 from app.utils.rate_limiter import rate_limiter
 from app.utils.exceptions import (
     SessionNotFoundException,
@@ -20,12 +23,16 @@ router = APIRouter()
 
 class Message(BaseModel):
     """消息模型"""
-    role: str = Field(..., pattern="^(user|assistant)$", description="角色")
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    role: Literal["user", "assistant"] = Field(..., description="角色")
     content: str = Field(..., description="消息内容")
 
 
 class ChatRequest(BaseModel):
     """聊天请求"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     session_id: Optional[str] = Field(None, description="会话ID（可选）")
     message: str = Field(..., min_length=1, max_length=2000, description="用户消息")
     context: Optional[Dict] = Field(default_factory=dict, description="额外上下文")
@@ -42,19 +49,50 @@ class ChatResponse(BaseModel):
 
 
 # 服务实例（单例）
-copilot = CopilotClient()
-session_manager = SessionManager()
+copilot = get_copilot()
 intent_classifier = IntentClassifier()
 
 
+async def send_json(websocket: WebSocket, data: Dict):
+    """使用 orjson 序列化并以文本帧发送（比 WebSocket.send_json 的标准库 json 更快）"""
+    await websocket.send_text(orjson.dumps(data).decode())
+
+
+# 流式回复合并发送的阈值：累计字符数或距上次发送的时间（秒）
+STREAM_FLUSH_CHARS = 512
+STREAM_FLUSH_INTERVAL = 0.02
+
+
+async def batch_chunks(stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """合并流式输出的小片段，按大小或时间批量产出，减少 WebSocket 帧数"""
+    buf = []
+    size = 0
+    last_flush = time.monotonic()
+    async for chunk in stream:
+        buf.append(chunk)
+        size += len(chunk)
+        now = time.monotonic()
+        if size >= STREAM_FLUSH_CHARS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+            yield "".join(buf)
+            buf.clear()
+            size = 0
+            last_flush = now
+    if buf:
+        yield "".join(buf)
+
+
 def check_rate_limit(client_id: str):
-    """检查限流"""
-    if not rate_limiter.is_allowed(client_id):
+    """检查限流（RATE_LIMIT_ENABLED 关闭时不限流，与全局限流中间件一致）"""
+    if settings.RATE_LIMIT_ENABLED and not rate_limiter.is_allowed(client_id):
         raise RateLimitExceededException()
 
 
-@router.post("/chat", response_model=ChatResponse, summary="智能对话")
-async def chat(request: ChatRequest):
+# 不设置 response_model，避免每次响应都做一遍 Pydantic 校验；ChatResponse 仅用于文档
+@router.post("/chat", responses={200: {"model": ChatResponse}}, summary="智能对话")
+async def chat(
+        request: ChatRequest,
+        session_manager: SessionManager = Depends(get_session_manager)
+):
     """
     智能对话接口
     
@@ -89,14 +127,14 @@ async def chat(request: ChatRequest):
         session_id = session["session_id"]
         history = session.get("history", [])
 
-        logger.info(f"会话 {session_id}: {request.message[:50]}...")
+        logger.info("会话 %s: %s...", session_id, request.message[:50])
 
         # 意图识别
         intent_result = await intent_classifier.classify(request.message, history)
         intent = intent_result.get("intent")
         entities = intent_result.get("entities", {})
 
-        logger.info(f"识别意图: {intent}, 实体: {entities}")
+        logger.info("识别意图: %s, 实体: %s", intent, entities)
 
         # 构建对话上下文
         context = {
@@ -112,24 +150,27 @@ async def chat(request: ChatRequest):
             context=context
         )
 
-        # 更新会话历史
-        await session_manager.add_message(
+        # 更新会话历史（一轮对话一次写入）
+        await session_manager.append_turn(
             session_id,
-            {"role": "user", "content": request.message, "intent": intent}
-        )
-        await session_manager.add_message(
-            session_id,
-            {"role": "assistant", "content": response["message"]}
+            {"role": "user", "content": request.message, "intent": intent},
+            {"role": "assistant", "content": response["message"]},
+            session=session
         )
 
-        return ChatResponse(
-            session_id=session_id,
-            message=response["message"],
-            intent=intent,
-            entities=entities,
-            suggested_actions=response.get("suggested_actions"),
-            products=response.get("products")
-        )
+        # 持久化聊天记录（入队后由后台任务批量写库）
+        user_id = session.get("user_id")
+        chat_writer.enqueue(session_id, "user", request.message, intent, user_id)
+        chat_writer.enqueue(session_id, "assistant", response["message"], user_id=user_id)
+
+        return {
+            "session_id": session_id,
+            "message": response["message"],
+            "intent": intent,
+            "entities": entities,
+            "suggested_actions": response.get("suggested_actions"),
+            "products": response.get("products")
+        }
 
     except (SessionNotFoundException, RateLimitExceededException, AIServiceException):
         raise
@@ -139,7 +180,10 @@ async def chat(request: ChatRequest):
 
 
 @router.get("/chat/history/{session_id}", summary="获取聊天历史")
-async def get_chat_history(session_id: str):
+async def get_chat_history(
+        session_id: str,
+        session_manager: SessionManager = Depends(get_session_manager)
+):
     """获取指定会话的聊天历史"""
     try:
         session = await session_manager.get_session(session_id)
@@ -148,9 +192,9 @@ async def get_chat_history(session_id: str):
         
         return {
             "session_id": session_id,
-            "history": session.get("history", []),
+            "history": [session_manager.to_public(m) for m in session.get("history", [])],
             "created_at": session.get("created_at"),
-            "last_activity": session.get("last_activity")
+            "last_activity": session_manager.last_activity_at(session)
         }
     except SessionNotFoundException:
         raise
@@ -160,13 +204,21 @@ async def get_chat_history(session_id: str):
 
 
 @router.delete("/chat/session/{session_id}", summary="清除会话")
-async def clear_session(session_id: str):
-    """清除指定会话及其历史记录"""
+async def clear_session(
+        session_id: str,
+        session_manager: SessionManager = Depends(get_session_manager)
+):
+    """清除指定会话及其历史记录（响应中直接给出清除后的状态，客户端无需再查询历史）"""
     try:
         success = await session_manager.delete_session(session_id)
         if not success:
             raise SessionNotFoundException(session_id)
-        return {"message": "会话已清除", "session_id": session_id}
+        return {
+            "message": "会话已清除",
+            "session_id": session_id,
+            "cleared": True,
+            "history": []
+        }
     except SessionNotFoundException:
         raise
     except Exception as e:
@@ -175,7 +227,10 @@ async def clear_session(session_id: str):
 
 
 @router.websocket("/chat/ws")
-async def websocket_chat(websocket: WebSocket):
+async def websocket_chat(
+        websocket: WebSocket,
+        session_manager: SessionManager = Depends(get_session_manager)
+):
     """
     WebSocket 实时聊天
     """
@@ -186,48 +241,56 @@ async def websocket_chat(websocket: WebSocket):
         while True:
             # 接收消息
             data = await websocket.receive_text()
-            request_data = json.loads(data)
+            request_data = orjson.loads(data)
 
             message = request_data.get("message")
             if not message:
-                await websocket.send_json({"error": "消息不能为空"})
+                await send_json(websocket, {"error": "消息不能为空"})
                 continue
 
-            # 创建或获取会话
-            if not session_id:
+            # 创建或获取会话（新建的会话无需再查询一次）
+            session = None
+            if session_id:
+                session = await session_manager.get_session(session_id)
+            if not session:
                 session = await session_manager.create_session()
                 session_id = session["session_id"]
-
-            session = await session_manager.get_session(session_id)
             history = session.get("history", [])
 
             # 意图识别
             intent_result = await intent_classifier.classify(message, history)
 
             # 发送意图识别结果
-            await websocket.send_json({
+            await send_json(websocket, {
                 "type": "intent",
                 "intent": intent_result.get("intent"),
                 "entities": intent_result.get("entities")
             })
 
-            # 流式生成回复
-            async for chunk in copilot.chat_stream(
+            # 流式生成回复（小片段合并后再发送）
+            chunks = []
+            async for chunk in batch_chunks(copilot.chat_stream(
                     message=message,
                     context={"history": history}
-            ):
-                await websocket.send_json({
+            )):
+                chunks.append(chunk)
+                await send_json(websocket, {
                     "type": "message_chunk",
                     "content": chunk
                 })
 
-            # 更新会话
-            await session_manager.add_message(
+            # 更新会话（一轮对话一次写入）
+            reply = "".join(chunks)
+            await session_manager.append_turn(
                 session_id,
-                {"role": "user", "content": message}
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": reply},
+                session=session
             )
+            chat_writer.enqueue(session_id, "user", message, intent_result.get("intent"))
+            chat_writer.enqueue(session_id, "assistant", reply)
 
-            await websocket.send_json({
+            await send_json(websocket, {
                 "type": "done",
                 "session_id": session_id
             })
@@ -236,4 +299,4 @@ async def websocket_chat(websocket: WebSocket):
         logger.info(f"WebSocket 连接断开: {session_id}")
     except Exception as e:
         logger.error(f"WebSocket 错误: {str(e)}")
-        await websocket.send_json({"error": str(e)})
\ No newline at end of file
+        await send_json(websocket, {"error": str(e)})
\ No newline at end of file
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from app.services.search_service import SearchService
-from app.services.copilot_client import CopilotClient
+from app.services.copilot_client import get_copilot
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +21,8 @@ class SearchRequest(BaseModel):
 
 
 class Product(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     id: str
     name: str
     description: str
@@ -43,11 +45,15 @@ class SearchResponse(BaseModel):
     ai_insights: Optional[str] = None
 
 
+# 商品列表整体交给 pydantic-core 批量校验，避免逐个构造 Product
+PRODUCT_LIST = TypeAdapter(List[Product])
+
 search_service = SearchService()
-copilot = CopilotClient()
+copilot = get_copilot()
 
 
-@router.post("/search", response_model=SearchResponse)
+# 不设置 response_model，避免每次响应都做一遍 Pydantic 校验；SearchResponse 仅用于文档
+@router.post("/search", responses={200: {"model": SearchResponse}})
 async def search_products(request: SearchRequest):
     """
     商品搜索接口
@@ -60,7 +66,7 @@ async def search_products(request: SearchRequest):
     - AI 增强搜索（理解用户意图，提供个性化结果）
     """
     try:
-        logger.info(f"搜索请求: {request.query}")
+        logger.info("搜索请求: %s", request.query)
 
         # 如果启用 AI，先让 AI 理解用户意图
         enhanced_query = request.query
@@ -70,7 +76,7 @@ async def search_products(request: SearchRequest):
             intent_result = await copilot.analyze_search_intent(request.query)
             enhanced_query = intent_result.get("enhanced_query", request.query)
             ai_insights = intent_result.get("insights")
-            logger.info(f"AI 增强查询: {enhanced_query}")
+            logger.info("AI 增强查询: %s", enhanced_query)
 
         # 执行搜索
         results = await search_service.search(
@@ -86,15 +92,16 @@ async def search_products(request: SearchRequest):
         # 获取搜索建议
         suggestions = await search_service.get_suggestions(request.query)
 
-        return SearchResponse(
-            query=request.query,
-            total=results["total"],
-            page=request.page,
-            page_size=request.page_size,
-            results=results["products"],
-            suggestions=suggestions,
-            ai_insights=ai_insights
-        )
+        return {
+            "query": request.query,
+            "total": results["total"],
+            "page": request.page,
+            "page_size": request.page_size,
+            # 校验后的 Product 列表直接返回，由 FastAPI 序列化，不再额外转回字典
+            "results": PRODUCT_LIST.validate_python(results["products"]),
+            "suggestions": suggestions,
+            "ai_insights": ai_insights
+        }
 
     except Exception as e:
         logger.error(f"搜索失败: {str(e)}")
@@ -1,12 +1,16 @@
 """服务层模块"""
-from .copilot_client import CopilotClient
+from .chat_writer import ChatHistoryWriter
+from .copilot_client import CopilotClient, get_copilot
 from .intent_classifier import IntentClassifier
 from .search_service import SearchService
-from .session_manager import SessionManager
+from .session_manager import SessionManager, get_session_manager
 
 __all__ = [
+    "ChatHistoryWriter",
     "CopilotClient",
+    "get_copilot",
     "IntentClassifier", 
     "SearchService",
-    "SessionManager"
+    "SessionManager",
+    "get_session_manager"
 ]
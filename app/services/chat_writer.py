@@ -0,0 +1,108 @@
+"""聊天历史异步批量写入"""
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+from sqlalchemy import insert
+
+from app.core.database import AsyncSessionLocal, ChatHistory
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryWriter:
+    """
+    聊天历史写入器
+
+    请求处理中只把消息放入内存队列，由后台任务批量 INSERT，
+    写库和提交不再占用接口响应时间，多条消息共享一次提交。
+    """
+
+    def __init__(self, maxsize: int = 10_000, batch_size: int = 100):
+        """
+        Args:
+            maxsize: 队列容量，队列满时丢弃新消息
+            batch_size: 单次写入的最大条数
+        """
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台写入任务（在事件循环中调用）"""
+        if self._task is None:
+            # 队列绑定当前事件循环，每次启动重新创建（应用可能在新的事件循环中重启，如测试中）
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+            logger.info("聊天历史写入任务已启动")
+
+    async def stop(self):
+        """停止后台写入任务，并写入队列中剩余的消息"""
+        if self._task is None:
+            return
+        # None 作为结束标记，排在已入队的消息之后
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("聊天历史写入任务已停止")
+
+    def enqueue(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        intent: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> bool:
+        """将一条消息加入写入队列（不等待写库）"""
+        if self._task is None:
+            return False
+        try:
+            self._queue.put_nowait({
+                "session_id": session_id,
+                "user_id": user_id,
+                "role": role,
+                "content": content,
+                "intent": intent
+            })
+            return True
+        except asyncio.QueueFull:
+            logger.warning("聊天历史写入队列已满，丢弃消息: %s", session_id)
+            return False
+
+    async def _run(self):
+        """从队列中取出消息并批量写入"""
+        while True:
+            item = await self._queue.get()
+            stopping = item is None
+            batch: List[Dict] = [] if stopping else [item]
+
+            # 取出队列中已有的消息，凑成一批
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: List[Dict]):
+        """批量写入数据库（executemany）"""
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(ChatHistory), batch)
+                await session.commit()
+        except Exception as e:
+            logger.error("写入聊天历史失败（%d 条）: %s", len(batch), e)
+
+
+# 全局写入器实例
+chat_writer = ChatHistoryWriter()
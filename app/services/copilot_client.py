@@ -1,37 +1,29 @@
 import anthropic
-from typing import Dict, List, Optional, AsyncGenerator
+import httpx
+from typing import Dict, List, Optional, Tuple, AsyncGenerator
+from functools import lru_cache
 from app.core.config import settings
 from app.utils.exceptions import AIServiceException
 from app.utils.cache import cached
 import logging
-import json
+import orjson
 import asyncio
+import time
 
 logger = logging.getLogger(__name__)
 
 
 class CopilotClient:
-    """AI Copilot 客户端 - 封装 Anthropic Claude API"""
-    
-    _instance = None
-    
-    def __new__(cls):
-        """单例模式"""
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
+    """AI Copilot 客户端 - 封装 Anthropic Claude API（通过 get_copilot() 获取共享实例）"""
+
     def __init__(self):
-        if not hasattr(self, 'initialized'):
-            if not settings.ANTHROPIC_API_KEY:
-                raise ValueError("ANTHROPIC_API_KEY 未配置")
-            
-            self.client = anthropic.AsyncAnthropic(
-                api_key=settings.ANTHROPIC_API_KEY,
-                timeout=settings.AI_TIMEOUT
-            )
-            self.model = settings.COPILOT_MODEL
-            self.initialized = True
+        if not settings.ANTHROPIC_API_KEY:
+            raise ValueError("ANTHROPIC_API_KEY 未配置")
+
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.client: Optional[anthropic.AsyncAnthropic] = None
+        self.start()
+        self.model = settings.COPILOT_MODEL
 
         # 系统提示词
         self.system_prompt = """你是一个专业的电商智能助手，名字叫"智购助手"。你的职责是：
@@ -50,6 +42,8 @@ class CopilotClient:
 
 当前时间：{current_time}
 """
+        # 渲染后的系统提示缓存：(分钟桶, 提示词)
+        self._sys_cache = (0, "")
 
     async def chat(
             self,
@@ -80,16 +74,14 @@ class CopilotClient:
             })
 
             # 构建系统提示
-            system = self.system_prompt.format(
-                current_time=self._get_current_time()
-            )
+            system = self._system()
 
             # 添加上下文信息
             if context:
                 if context.get("intent"):
                     system += f"\n\n当前用户意图：{context['intent']}"
                 if context.get("entities"):
-                    system += f"\n识别到的实体：{json.dumps(context['entities'], ensure_ascii=False)}"
+                    system += f"\n识别到的实体：{orjson.dumps(context['entities']).decode()}"
 
             # 调用 API（带超时）
             response = await asyncio.wait_for(
@@ -134,9 +126,7 @@ class CopilotClient:
                 messages.extend(context["history"][-10:])
             messages.append({"role": "user", "content": message})
 
-            system = self.system_prompt.format(
-                current_time=self._get_current_time()
-            )
+            system = self._system()
 
             async with self.client.messages.stream(
                     model=self.model,
@@ -206,8 +196,8 @@ class CopilotClient:
         try:
             prompt = f"""基于用户画像和浏览历史，推荐合适的商品：
 
-用户画像：{json.dumps(user_profile, ensure_ascii=False)}
-浏览历史：{json.dumps(browsing_history[-10:], ensure_ascii=False)}
+用户画像：{orjson.dumps(user_profile).decode()}
+浏览历史：{orjson.dumps(browsing_history[-10:]).decode()}
 
 请推荐 {limit} 个商品，返回 JSON 格式：
 [
@@ -233,6 +223,32 @@ class CopilotClient:
             logger.error(f"推荐生成失败: {str(e)}")
             return []
 
+    def start(self):
+        """
+        创建共享 HTTP 连接池和 API 客户端（应用启动时调用，已在使用中时不做任何事）
+
+        应用生命周期可能多次进入（如测试中），上次关闭后在这里重新创建
+        """
+        if self.http_client is not None and not self.http_client.is_closed:
+            return
+
+        # 共享 HTTP 连接池，复用到 Anthropic API 的 keep-alive 连接
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.AI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        self.client = anthropic.AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            timeout=settings.AI_TIMEOUT,
+            http_client=self.http_client
+        )
+
+    async def close(self):
+        """关闭共享的 HTTP 连接池（应用关闭时调用）"""
+        await self.http_client.aclose()
+
     def _parse_response(self, content: str) -> Dict:
         """解析回复内容"""
         result = {"message": content}
@@ -246,23 +262,93 @@ class CopilotClient:
 
     def _extract_json(self, text: str) -> Optional[Dict]:
         """从文本中提取 JSON"""
+        # 优先查找 ``` 代码块（可带 json 标记）
+        fence = text.find("```")
+        if fence != -1:
+            body_start = fence + 3
+            if text.startswith("json", body_start):
+                body_start += 4
+            body_end = text.find("```", body_start)
+            if body_end != -1:
+                try:
+                    return orjson.loads(text[body_start:body_end])
+                except ValueError:
+                    pass
+
+        # 线性扫描第一个完整的 {...} 或 [...]
+        result = self._scan_json(text)
+        if result is not None:
+            return result
+
+        # 尝试直接解析整个文本
         try:
-            # 查找 JSON 块
-            import re
-            json_pattern = r'```json\s*(.*?)\s*```|```\s*(.*?)\s*```|(\{.*\}|\[.*\])'
-            matches = re.findall(json_pattern, text, re.DOTALL)
-
-            for match in matches:
-                json_str = next((m for m in match if m), None)
-                if json_str:
-                    return json.loads(json_str)
-
-            # 尝试直接解析整个文本
-            return json.loads(text)
-        except:
+            return orjson.loads(text)
+        except ValueError:
             return None
 
-    def _get_current_time(self) -> str:
-        """获取当前时间"""
-        from datetime import datetime
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
+    @staticmethod
+    def _scan_json(text: str) -> Optional[Dict]:
+        """
+        单次从左到右扫描文本，按括号深度找出完整的 JSON 对象/数组并解析
+
+        跟踪字符串和转义状态，字符串内的括号不计入深度；最外层片段闭合时立即尝试解析，
+        失败则继续向后扫描。扫描时为每个未闭合的括号记录其中已闭合的直接子片段，
+        文本结束时仍有括号未闭合（如回复被截断），按顺序尝试这些子片段，
+        不回头重新扫描，整体为 O(n)。
+        """
+        # 未闭合的括号：(起始位置, 其中已闭合的直接子片段 [(起, 止), ...])
+        stack: List[Tuple[int, List[Tuple[int, int]]]] = []
+        in_str = False
+        escape = False
+        for i, ch in enumerate(text):
+            if in_str:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_str = False
+            elif ch == "{" or ch == "[":
+                stack.append((i, []))
+            elif not stack:
+                # 片段之外的字符（包括引号和多余的右括号）直接跳过
+                continue
+            elif ch == '"':
+                in_str = True
+            elif ch == "}" or ch == "]":
+                start = stack.pop()[0]
+                if stack:
+                    stack[-1][1].append((start, i + 1))
+                    continue
+                try:
+                    return orjson.loads(text[start:i + 1])
+                except ValueError:
+                    pass
+
+        # 括号未闭合：其中已闭合的子片段按出现顺序依次尝试
+        for _, children in stack:
+            for start, end in children:
+                try:
+                    return orjson.loads(text[start:end])
+                except ValueError:
+                    pass
+
+        return None
+
+    def _system(self) -> str:
+        """获取渲染后的系统提示（按分钟缓存，避免每次请求都格式化时间和模板）"""
+        bucket = int(time.time() // 60)
+        if bucket != self._sys_cache[0]:
+            self._sys_cache = (
+                bucket,
+                self.system_prompt.format(
+                    current_time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+                )
+            )
+        return self._sys_cache[1]
+
+
+@lru_cache()
+def get_copilot() -> CopilotClient:
+    """获取 Copilot 客户端单例"""
+    return CopilotClient()
@@ -1,16 +1,40 @@
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import re
 import logging
 
+import ahocorasick
+
 logger = logging.getLogger(__name__)
 
+# 正则元字符：不含这些字符的多选分支可以按普通关键词匹配
+_REGEX_META = frozenset(".^$*+?{}[]\\()|")
+
+
+def _as_keywords(pattern: str) -> Optional[List[str]]:
+    """
+    若模式只是关键词的多选（如 "找|搜|推荐"），返回关键词列表，否则返回 None
+
+    分支首尾的 ".*" 不影响 search 的结果（".*价" 等价于包含 "价"），会被去掉
+    """
+    keywords = []
+    for alt in pattern.split("|"):
+        while alt.startswith(".*"):
+            alt = alt[2:]
+        while alt.endswith(".*"):
+            alt = alt[:-2]
+        if not alt or any(ch in _REGEX_META for ch in alt):
+            return None
+        keywords.append(alt.lower())
+    return keywords
+
 
 class IntentClassifier:
     """意图分类器 - 识别用户意图和提取实体"""
 
     def __init__(self):
         # 意图关键词映射
-        self.intent_patterns = {
+        intent_patterns = {
             "search_product": [
                 r"找|搜|推荐|有没有|想买|看看",
                 r"什么.*好|哪个.*好|求推荐"
@@ -45,14 +69,63 @@ class IntentClassifier:
             ]
         }
 
-        # 实体提取模式
-        self.entity_patterns = {
-            "product_name": r"(iPhone|MacBook|AirPods|iPad|Nike|Adidas|戴森|小米|华为)",
-            "color": r"(红色|蓝色|黑色|白色|金色|银色|粉色|绿色)",
-            "size": r"(XS|S|M|L|XL|XXL|加大|加小|\d+码)",
-            "price_range": r"(\d+).*到.*(\d+)|(\d+).*以下|(\d+).*以上",
-            "order_number": r"订单号[:：]?\s*([A-Z0-9]{10,})"
+        # 实体关键词：固定的关键词集合，提取时返回规范写法
+        entity_keywords = {
+            "product_name": [
+                "iPhone", "MacBook", "AirPods", "iPad", "Nike", "Adidas", "戴森", "小米", "华为"
+            ],
+            "color": ["红色", "蓝色", "黑色", "白色", "金色", "银色", "粉色", "绿色"],
+            "size": ["XS", "S", "M", "L", "XL", "XXL", "加大", "加小"]
+        }
+        # 实体提取模式（非固定关键词的实体）
+        # 分组名即实体类型，合并为一个正则后一次扫描即可提取
+        entity_patterns = {
+            "size": r"(?P<size>\d+码)",
+            "order_number": r"订单号[:：]?\s*(?P<order_number>[A-Z0-9]{10,})"
         }
+        # 价格范围需要按分组换算数值，单独匹配
+        price_range_pattern = r"(\d+).*到.*(\d+)|(\d+).*以下|(\d+).*以上"
+
+        # 纯关键词模式放入 Aho-Corasick 自动机，一次扫描即可匹配所有关键词；
+        # 含通配符的模式仍使用预编译正则。每个模式有一个编号，命中即计 1 分
+        self._pattern_intents: List[str] = []
+        self.intent_regexes: List[tuple] = []
+        keyword_patterns: Dict[str, List[int]] = {}
+        for intent, patterns in intent_patterns.items():
+            for pattern in patterns:
+                pattern_id = len(self._pattern_intents)
+                self._pattern_intents.append(intent)
+                keywords = _as_keywords(pattern)
+                if keywords is None:
+                    self.intent_regexes.append(
+                        (pattern_id, re.compile(pattern, re.IGNORECASE))
+                    )
+                    continue
+                for keyword in keywords:
+                    keyword_patterns.setdefault(keyword, []).append(pattern_id)
+
+        self.intent_automaton = ahocorasick.Automaton()
+        for keyword, pattern_ids in keyword_patterns.items():
+            self.intent_automaton.add_word(keyword, pattern_ids)
+        self.intent_automaton.make_automaton()
+
+        # 实体关键词放入 Aho-Corasick 自动机，值为 (关键词长度, 实体类型, 规范写法)
+        self.entity_automaton = ahocorasick.Automaton()
+        for entity_type, keywords in entity_keywords.items():
+            for keyword in keywords:
+                self.entity_automaton.add_word(
+                    keyword.lower(), (len(keyword), entity_type, keyword)
+                )
+        self.entity_automaton.make_automaton()
+
+        # 预编译实体模式
+        self.entity_re = re.compile("|".join(entity_patterns.values()), re.IGNORECASE)
+        self.price_range_re = re.compile(price_range_pattern)
+        self._digit_re = re.compile(r"\d")
+
+        # 与历史无关的分类结果按消息文本缓存（每个实例独立、容量有限），
+        # "好的"、"多少钱" 这类高频短句无需重复匹配
+        self._classify_stateless = lru_cache(maxsize=4096)(self._classify_stateless)
 
     async def classify(
             self,
@@ -74,11 +147,9 @@ class IntentClassifier:
             }
         """
         try:
-            # 识别意图
-            intent, confidence = self._classify_intent(message)
-
-            # 提取实体
-            entities = self._extract_entities(message)
+            # 识别意图、提取实体（结果已缓存）
+            intent, confidence, entity_items = self._classify_stateless(message)
+            entities = dict(entity_items)
 
             # 考虑上下文（如果有历史记录）
             if history and len(history) > 0:
@@ -86,7 +157,7 @@ class IntentClassifier:
                 if context_intent:
                     intent = context_intent
 
-            logger.info(f"意图分类: {intent} (置信度: {confidence:.2f})")
+            logger.info("意图分类: %s (置信度: %.2f)", intent, confidence)
 
             return {
                 "intent": intent,
@@ -95,26 +166,34 @@ class IntentClassifier:
             }
 
         except Exception as e:
-            logger.error(f"意图分类失败: {str(e)}")
+            logger.error("意图分类失败: %s", e)
             return {
                 "intent": "unknown",
                 "confidence": 0.0,
                 "entities": {}
             }
 
+    def _classify_stateless(self, message: str) -> Tuple[str, float, tuple]:
+        """识别意图并提取实体（不依赖历史），实体以元组返回以免缓存值被修改"""
+        intent, confidence = self._classify_intent(message)
+        entities = self._extract_entities(message)
+        return intent, confidence, tuple(entities.items())
+
     def _classify_intent(self, message: str) -> tuple:
         """分类意图"""
-        message_lower = message.lower()
+        # 关键词一次扫描，再补充通配符模式
+        matched = set()
+        for _, pattern_ids in self.intent_automaton.iter(message.lower()):
+            matched.update(pattern_ids)
+        for pattern_id, pattern in self.intent_regexes:
+            if pattern_id not in matched and pattern.search(message):
+                matched.add(pattern_id)
 
-        # 匹配所有意图模式
+        # 统计每个意图命中的模式数（按编号顺序，保持意图定义的先后顺序）
         matches = {}
-        for intent, patterns in self.intent_patterns.items():
-            score = 0
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    score += 1
-            if score > 0:
-                matches[intent] = score
+        for pattern_id in sorted(matched):
+            intent = self._pattern_intents[pattern_id]
+            matches[intent] = matches.get(intent, 0) + 1
 
         # 如果没有匹配，返回通用意图
         if not matches:
@@ -130,22 +209,40 @@ class IntentClassifier:
         """提取实体"""
         entities = {}
 
-        for entity_type, pattern in self.entity_patterns.items():
-            match = re.search(pattern, message, re.IGNORECASE)
+        # 收集关键词和正则的所有命中：(起点, 终点, 实体类型, 值)
+        spans = [
+            (end - length + 1, end + 1, entity_type, value)
+            for end, (length, entity_type, value) in self.entity_automaton.iter(message.lower())
+        ]
+        spans.extend(
+            (match.start(), match.end(), match.lastgroup, match.group(match.lastgroup))
+            for match in self.entity_re.finditer(message)
+        )
+
+        # 按最左最长选取互不重叠的命中（如 "XL" 不再拆出 "L"，"MacBook" 中的 "M" 不算尺码），
+        # 每种实体只保留第一次出现的值
+        spans.sort(key=lambda span: (span[0], span[0] - span[1]))
+        last_end = 0
+        for start, end, entity_type, value in spans:
+            if start < last_end:
+                continue
+            last_end = end
+            if entity_type not in entities:
+                entities[entity_type] = value
+
+        # 价格范围（消息中没有数字时无需匹配）
+        if self._digit_re.search(message):
+            match = self.price_range_re.search(message)
             if match:
-                if entity_type == "price_range":
-                    # 处理价格范围
-                    groups = [g for g in match.groups() if g]
-                    if len(groups) >= 2:
+                groups = [g for g in match.groups() if g]
+                if len(groups) >= 2:
+                    entities["min_price"] = int(groups[0])
+                    entities["max_price"] = int(groups[1])
+                elif len(groups) == 1:
+                    if "以下" in message:
+                        entities["max_price"] = int(groups[0])
+                    elif "以上" in message:
                         entities["min_price"] = int(groups[0])
-                        entities["max_price"] = int(groups[1])
-                    elif len(groups) == 1:
-                        if "以下" in message:
-                            entities["max_price"] = int(groups[0])
-                        elif "以上" in message:
-                            entities["min_price"] = int(groups[0])
-                else:
-                    entities[entity_type] = match.group(1)
 
         return entities
 
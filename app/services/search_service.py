@@ -1,16 +1,94 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
 from app.core.database import get_db
+import heapq
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class _NgramIndex:
+    """
+    字符 n-gram 倒排索引（单字 + 相邻二元组）
+
+    不依赖分词，中英文混排都适用：子串查询的每个二元组必然出现在目标文本中，
+    取各倒排表的交集即为候选集，调用方只需对候选做子串校验
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+
+    def add(self, doc_id: int, text: str):
+        """索引一段文本（应已转为小写）"""
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def candidates(self, query: str) -> Set[int]:
+        """返回可能包含 query 的文档 ID（query 应已转为小写且非空）"""
+        if len(query) == 1:
+            grams = {query}
+        else:
+            grams = {query[i:i + 2] for i in range(len(query) - 1)}
+
+        postings = []
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+
+        # 从最短的倒排表开始求交集
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+
 class SearchService:
     """商品搜索服务"""
 
+    # 搜索建议词
+    SUGGESTIONS = [
+        "iPhone 15 Pro",
+        "MacBook Pro",
+        "AirPods Pro",
+        "运动鞋",
+        "连衣裙",
+        "笔记本电脑",
+        "无线耳机",
+        "智能手表"
+    ]
+
     def __init__(self):
         self.db = None
 
+        # 商品数据只加载一次，并建立 ID 映射和倒排索引
+        self._products = self._get_mock_products()
+        self._products_by_id = {p["id"]: p for p in self._products}
+        self._product_index = _NgramIndex()
+        # 预先计算每个商品的小写检索文本（与 self._products 按下标对应，不放进商品字典，
+        # 避免随接口返回）。名称和描述分别建索引，跨换行的查询召回不到，不会误匹配
+        self._search_texts: List[str] = []
+        for i, p in enumerate(self._products):
+            name_lower = p["name"].lower()
+            description_lower = p["description"].lower()
+            self._product_index.add(i, name_lower)
+            self._product_index.add(i, description_lower)
+            self._search_texts.append(f"{name_lower}\n{description_lower}")
+
+        # 预先计算热度分（评分 × 评论数），与 self._products 按下标对应
+        self._trending_scores: List[float] = [
+            p.get("rating", 0) * p.get("reviews_count", 0) for p in self._products
+        ]
+
+        self._suggestion_index = _NgramIndex()
+        for i, suggestion in enumerate(self.SUGGESTIONS):
+            self._suggestion_index.add(i, suggestion.lower())
+
     async def search(
             self,
             query: str,
@@ -52,12 +130,7 @@ class SearchService:
     async def get_product_by_id(self, product_id: str) -> Optional[Dict]:
         """根据 ID 获取商品详情"""
         try:
-            # 模拟数据
-            products = self._get_mock_products()
-            for product in products:
-                if product["id"] == product_id:
-                    return product
-            return None
+            return self._products_by_id.get(product_id)
         except Exception as e:
             logger.error(f"获取商品失败: {str(e)}")
             raise
@@ -77,31 +150,26 @@ class SearchService:
 
     async def get_trending_products(self, limit: int = 10) -> List[Dict]:
         """获取热门商品"""
-        products = self._get_mock_products()
-        # 按评分排序
-        sorted_products = sorted(
-            products,
-            key=lambda x: x.get("rating", 0) * x.get("reviews_count", 0),
-            reverse=True
+        # 只取前 limit 个，用堆代替全量排序：O(N log k)
+        top_ids = heapq.nlargest(
+            limit,
+            range(len(self._products)),
+            key=self._trending_scores.__getitem__
         )
-        return sorted_products[:limit]
+        return [self._products[i] for i in top_ids]
 
     async def get_suggestions(self, query: str) -> List[str]:
         """获取搜索建议"""
-        # 模拟搜索建议
-        all_suggestions = [
-            "iPhone 15 Pro",
-            "MacBook Pro",
-            "AirPods Pro",
-            "运动鞋",
-            "连衣裙",
-            "笔记本电脑",
-            "无线耳机",
-            "智能手表"
-        ]
+        query_lower = query.lower()
+        if not query_lower:
+            return self.SUGGESTIONS[:5]
 
-        # 简单的模糊匹配
-        suggestions = [s for s in all_suggestions if query.lower() in s.lower()]
+        # 通过倒排索引召回候选，再做子串校验（保持原有顺序）
+        suggestions = [
+            self.SUGGESTIONS[i]
+            for i in sorted(self._suggestion_index.candidates(query_lower))
+            if query_lower in self.SUGGESTIONS[i].lower()
+        ]
         return suggestions[:5]
 
     def _mock_search(
@@ -113,28 +181,24 @@ class SearchService:
             sort_by: str
     ) -> List[Dict]:
         """模拟搜索"""
-        products = self._get_mock_products()
-
-        # 关键词过滤
-        if query:
-            query_lower = query.lower()
-            products = [
-                p for p in products
-                if query_lower in p["name"].lower()
-                   or query_lower in p["description"].lower()
-            ]
-
-        # 分类过滤
-        if category:
-            products = [p for p in products if p["category"] == category]
-
-        # 价格过滤
-        if min_price is not None:
-            products = [p for p in products if p["price"] >= min_price]
-        if max_price is not None:
-            products = [p for p in products if p["price"] <= max_price]
-
-        # 排序
+        # 有关键词时通过倒排索引召回候选（保持原有顺序），否则遍历全部商品
+        query_lower = query.lower() if query else ""
+        if query_lower:
+            candidate_ids = sorted(self._product_index.candidates(query_lower))
+        else:
+            candidate_ids = range(len(self._products))
+
+        # 关键词、分类、价格过滤合并为一次遍历
+        candidates = ((self._products[i], self._search_texts[i]) for i in candidate_ids)
+        products = [
+            p for p, text in candidates
+            if (not query_lower or query_lower in text)
+            and (not category or p["category"] == category)
+            and (min_price is None or p["price"] >= min_price)
+            and (max_price is None or p["price"] <= max_price)
+        ]
+
+        # 排序（products 是新列表，可原地排序）
         if sort_by == "price_asc":
             products.sort(key=lambda x: x["price"])
         elif sort_by == "price_desc":
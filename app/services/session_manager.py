@@ -1,31 +1,33 @@
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import time
 import uuid
 import logging
 import asyncio
 from app.core.config import settings
+from app.services.chat_writer import chat_writer
 
 logger = logging.getLogger(__name__)
 
+# 分片数量：按会话 ID 哈希到不同分片，每个分片一把锁，避免全局锁竞争
+_NUM_SHARDS = 16
+
 
 class SessionManager:
-    """会话管理器 - 管理用户对话会话（单例模式）"""
-    
-    _instance = None
-    
-    def __new__(cls):
-        """单例模式"""
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    """会话管理器 - 管理用户对话会话（应用内通过 get_session_manager 共享实例）"""
     
     def __init__(self):
-        if not hasattr(self, 'initialized'):
-            # 使用内存存储（生产环境应使用 Redis）
-            self.sessions: Dict[str, Dict] = {}
-            self.session_timeout = timedelta(seconds=settings.SESSION_TIMEOUT)
-            self._cleanup_task = None
-            self.initialized = True
+        # 使用内存存储（生产环境应使用 Redis）
+        # 每个分片按最近活动时间排序：最久未活动的在最前，最近活动的在最后
+        self._shards: List["OrderedDict[str, Dict]"] = [
+            OrderedDict() for _ in range(_NUM_SHARDS)
+        ]
+        self._locks = [asyncio.Lock() for _ in range(_NUM_SHARDS)]
+        # 过期判断使用单调时钟（浮点秒），不受系统时间调整影响
+        self.session_timeout: float = float(settings.SESSION_TIMEOUT)
+        self._cleanup_task = None
     
     def start_cleanup_task(self):
         """启动清理任务（在事件循环中调用）"""
@@ -37,6 +39,31 @@ class SessionManager:
                 # 如果没有运行的事件循环，忽略
                 pass
 
+    def _shard(self, session_id: str) -> Tuple["OrderedDict[str, Dict]", asyncio.Lock]:
+        """获取会话所在分片及其锁"""
+        idx = hash(session_id) % _NUM_SHARDS
+        return self._shards[idx], self._locks[idx]
+
+    def _lookup_active(self, sessions: "OrderedDict[str, Dict]", session_id: str) -> Optional[Dict]:
+        """查找未过期的会话并更新活动时间（一次过期检查、一次时间写入，调用方需持有分片锁）"""
+        session = sessions.get(session_id)
+
+        if not session:
+            logger.warning("会话不存在: %s", session_id)
+            return None
+
+        # 检查会话是否过期
+        if self._is_expired(session):
+            logger.info("会话已过期: %s", session_id)
+            del sessions[session_id]
+            logger.info("删除会话: %s", session_id)
+            return None
+
+        # 更新活动时间，并移到末尾保持按活动时间排序
+        session["last_activity"] = time.monotonic()
+        sessions.move_to_end(session_id)
+        return session
+
     async def create_session(self, user_id: Optional[str] = None) -> Dict:
         """创建新会话"""
         session_id = str(uuid.uuid4())
@@ -44,106 +71,144 @@ class SessionManager:
             "session_id": session_id,
             "user_id": user_id,
             "created_at": datetime.utcnow(),
-            "last_activity": datetime.utcnow(),
+            "last_activity": time.monotonic(),
             "history": [],
             "context": {},
             "metadata": {}
         }
-        self.sessions[session_id] = session
-        logger.info(f"创建会话: {session_id}")
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            sessions[session_id] = session
+        logger.info("创建会话: %s", session_id)
         return session
 
     async def get_session(self, session_id: str) -> Optional[Dict]:
         """获取会话"""
-        session = self.sessions.get(session_id)
-
-        if not session:
-            logger.warning(f"会话不存在: {session_id}")
-            return None
-
-        # 检查会话是否过期
-        if self._is_expired(session):
-            logger.info(f"会话已过期: {session_id}")
-            await self.delete_session(session_id)
-            return None
-
-        # 更新活动时间
-        session["last_activity"] = datetime.utcnow()
-        return session
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            return self._lookup_active(sessions, session_id)
 
     async def add_message(
         self, 
         session_id: str, 
         message: Dict,
-        save_to_db: bool = False
+        save_to_db: bool = False,
+        session: Optional[Dict] = None
     ) -> bool:
-        """添加消息到会话历史"""
-        session = await self.get_session(session_id)
-        if not session:
-            logger.warning(f"无法添加消息，会话不存在: {session_id}")
-            return False
+        """添加消息到会话历史（session: 本次请求中已获取的会话，传入时不再重复查询）"""
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            if session is None:
+                session = self._lookup_active(sessions, session_id)
+            if not session:
+                logger.warning("无法添加消息，会话不存在: %s", session_id)
+                return False
 
-        # 添加时间戳
-        message_with_timestamp = {
-            **message,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        session["history"].append(message_with_timestamp)
+            # 添加时间戳（内部保存 epoch 秒，返回给用户时再格式化）
+            message_with_timestamp = {
+                **message,
+                "timestamp": time.time()
+            }
 
-        # 限制历史记录长度
-        max_history = settings.MAX_CONVERSATION_HISTORY * 2  # 用户+助手各算一条
-        if len(session["history"]) > max_history:
-            session["history"] = session["history"][-max_history:]
-            logger.debug(f"会话历史已截断: {session_id}")
+            session["history"].append(message_with_timestamp)
+            self._trim_history(session)
 
-        # TODO: 如果需要持久化，保存到数据库
+        # 需要持久化时交给聊天历史写入器，由后台任务批量写入数据库
         if save_to_db:
-            pass  # 实现数据库保存逻辑
+            chat_writer.enqueue(
+                session_id, message["role"], message["content"], message.get("intent")
+            )
 
         return True
 
-    async def update_context(self, session_id: str, context: Dict) -> bool:
-        """更新会话上下文"""
-        session = await self.get_session(session_id)
-        if not session:
-            return False
+    async def append_turn(
+        self,
+        session_id: str,
+        user_message: Dict,
+        assistant_message: Dict,
+        session: Optional[Dict] = None
+    ) -> bool:
+        """添加一轮对话（用户消息 + 助手回复），只查询一次会话
+
+        session: 本次请求中已获取的会话，传入时不再重复查询
+        """
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            if session is None:
+                session = self._lookup_active(sessions, session_id)
+            if not session:
+                logger.warning("无法添加消息，会话不存在: %s", session_id)
+                return False
+
+            timestamp = time.time()
+            session["history"].append({**user_message, "timestamp": timestamp})
+            session["history"].append({**assistant_message, "timestamp": timestamp})
+            self._trim_history(session)
 
-        session["context"].update(context)
-        logger.debug(f"更新会话上下文: {session_id}")
+        return True
+
+    async def update_context(
+        self,
+        session_id: str,
+        context: Dict,
+        session: Optional[Dict] = None
+    ) -> bool:
+        """更新会话上下文（session: 本次请求中已获取的会话，传入时不再重复查询）"""
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            if session is None:
+                session = self._lookup_active(sessions, session_id)
+            if not session:
+                return False
+
+            session["context"].update(context)
+        logger.debug("更新会话上下文: %s", session_id)
         return True
     
-    async def update_metadata(self, session_id: str, metadata: Dict) -> bool:
-        """更新会话元数据"""
-        session = await self.get_session(session_id)
-        if not session:
-            return False
-        
-        session["metadata"].update(metadata)
+    async def update_metadata(
+        self,
+        session_id: str,
+        metadata: Dict,
+        session: Optional[Dict] = None
+    ) -> bool:
+        """更新会话元数据（session: 本次请求中已获取的会话，传入时不再重复查询）"""
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            if session is None:
+                session = self._lookup_active(sessions, session_id)
+            if not session:
+                return False
+
+            session["metadata"].update(metadata)
         return True
 
     async def delete_session(self, session_id: str) -> bool:
         """删除会话"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            logger.info(f"删除会话: {session_id}")
-            return True
-        return False
+        sessions, lock = self._shard(session_id)
+        async with lock:
+            if sessions.pop(session_id, None) is None:
+                return False
+        logger.info("删除会话: %s", session_id)
+        return True
 
     async def cleanup_expired_sessions(self) -> int:
         """清理过期会话"""
-        expired_sessions = [
-            sid for sid, session in self.sessions.items()
-            if self._is_expired(session)
-        ]
+        # 逐个分片清理，每次只持有一个分片的锁；
+        # 分片内按活动时间排序，从最前面开始删除，遇到未过期的即可停止
+        count = 0
+        for sessions, lock in zip(self._shards, self._locks):
+            async with lock:
+                while sessions:
+                    session_id, session = next(iter(sessions.items()))
+                    if not self._is_expired(session):
+                        break
+                    del sessions[session_id]
+                    count += 1
 
-        for session_id in expired_sessions:
-            await self.delete_session(session_id)
-
-        if expired_sessions:
-            logger.info(f"清理了 {len(expired_sessions)} 个过期会话")
+        if count:
+            logger.info("清理了 %d 个过期会话", count)
         
-        return len(expired_sessions)
+        return count
     
     async def _cleanup_loop(self):
         """定期清理过期会话"""
@@ -152,23 +217,59 @@ class SessionManager:
                 await asyncio.sleep(300)  # 每5分钟清理一次
                 await self.cleanup_expired_sessions()
             except Exception as e:
-                logger.error(f"清理会话失败: {e}")
+                logger.error("清理会话失败: %s", e)
     
     def get_session_count(self) -> int:
         """获取当前会话数量"""
-        return len(self.sessions)
+        return sum(len(sessions) for sessions in self._shards)
     
     def get_active_sessions(self, minutes: int = 5) -> List[str]:
         """获取最近活跃的会话"""
-        cutoff_time = datetime.utcnow() - timedelta(minutes=minutes)
-        return [
-            sid for sid, session in self.sessions.items()
-            if session.get("last_activity", datetime.min) > cutoff_time
-        ]
+        cutoff_time = time.monotonic() - minutes * 60
+        # 每个分片从最近活动的会话往前找，遇到不活跃的即可停止
+        active = []
+        for sessions in self._shards:
+            for sid in reversed(sessions):
+                if sessions[sid].get("last_activity", 0.0) <= cutoff_time:
+                    break
+                active.append(sid)
+        return active
+
+    def _trim_history(self, session: Dict):
+        """限制历史记录长度"""
+        max_history = settings.MAX_CONVERSATION_HISTORY * 2  # 用户+助手各算一条
+        if len(session["history"]) > max_history:
+            session["history"] = session["history"][-max_history:]
+            logger.debug("会话历史已截断: %s", session["session_id"])
 
     def _is_expired(self, session: Dict) -> bool:
         """检查会话是否过期"""
         last_activity = session.get("last_activity")
-        if not last_activity:
+        if last_activity is None:
             return True
-        return datetime.utcnow() - last_activity > self.session_timeout
\ No newline at end of file
+        return time.monotonic() - last_activity > self.session_timeout
+
+    @staticmethod
+    def last_activity_at(session: Dict) -> datetime:
+        """将单调时钟的最后活动时间换算为 UTC 时间（用于展示）"""
+        elapsed = time.monotonic() - session["last_activity"]
+        return datetime.utcnow() - timedelta(seconds=elapsed)
+
+    @staticmethod
+    def to_public(message: Dict) -> Dict:
+        """将消息转换为对外展示的格式（时间戳格式化为 ISO 8601 UTC 时间）"""
+        timestamp = message.get("timestamp")
+        if not isinstance(timestamp, float):
+            return message
+        return {
+            **message,
+            "timestamp": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            )
+        }
+
+
+@lru_cache()
+def get_session_manager() -> SessionManager:
+    """获取会话管理器单例（路由中通过 Depends 注入，测试中可覆盖）"""
+    return SessionManager()
@@ -1,90 +1,127 @@
 """缓存工具"""
-import json
-from typing import Optional, Any, Callable
+from collections import OrderedDict
+from typing import Optional, Any, Callable, Iterable, Tuple
 from functools import wraps
-import hashlib
+import inspect
 import logging
+import time
+import orjson
+import xxhash
 
 logger = logging.getLogger(__name__)
 
 
 class CacheManager:
-    """缓存管理器（内存缓存，生产环境建议使用 Redis）"""
+    """缓存管理器（内存 LRU 缓存，生产环境建议使用 Redis）"""
     
-    def __init__(self):
-        self._cache = {}
-        self._ttl = {}
+    def __init__(self, maxsize: int = 10_000):
+        """
+        Args:
+            maxsize: 最大缓存条数，超出时淘汰最久未使用的条目
+        """
+        self.maxsize = maxsize
+        # 按最近访问排序：值为 (缓存值, 过期时间)，过期时间为 None 表示不过期
+        self._cache: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
     
     def get(self, key: str) -> Optional[Any]:
         """获取缓存"""
-        if key in self._cache:
-            import time
-            if key in self._ttl and time.time() > self._ttl[key]:
-                del self._cache[key]
-                del self._ttl[key]
-                return None
-            return self._cache[key]
-        return None
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() > expires_at:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return value
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """设置缓存"""
-        self._cache[key] = value
-        if ttl:
-            import time
-            self._ttl[key] = time.time() + ttl
+        # 过期时间使用单调时钟，不受系统时间调整影响
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._cache[key] = (value, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
     
     def delete(self, key: str):
         """删除缓存"""
-        if key in self._cache:
-            del self._cache[key]
-        if key in self._ttl:
-            del self._ttl[key]
+        self._cache.pop(key, None)
     
     def clear(self):
         """清空缓存"""
         self._cache.clear()
-        self._ttl.clear()
 
 
 # 全局缓存实例
 cache = CacheManager()
 
 
-def cached(ttl: int = 3600, key_prefix: str = ""):
-    """缓存装饰器"""
+def cached(ttl: int = 3600, key_prefix: str = "", exclude: Iterable[str] = ()):
+    """
+    缓存装饰器
+
+    Args:
+        ttl: 缓存时间（秒）
+        key_prefix: 缓存键前缀
+        exclude: 不参与缓存键计算的参数名（如数据库会话等不可序列化的对象）
+    """
     def decorator(func: Callable):
+        params = list(inspect.signature(func).parameters)
+        # 方法的 self/cls 不参与缓存键计算，其 repr 不稳定且与结果无关
+        skip = {0} if params and params[0] in ("self", "cls") else set()
+        skip.update(i for i, name in enumerate(params) if name in exclude)
+        excluded = frozenset(exclude)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = _generate_cache_key(func.__name__, key_prefix, args, kwargs)
-            
+            key_args = args
+            if skip:
+                key_args = tuple(a for i, a in enumerate(args) if i not in skip)
+            key_kwargs = kwargs
+            if excluded:
+                key_kwargs = {k: v for k, v in kwargs.items() if k not in excluded}
+            cache_key = _generate_cache_key(func.__name__, key_prefix, key_args, key_kwargs)
+
             # 尝试从缓存获取
             cached_value = cache.get(cache_key)
             if cached_value is not None:
-                logger.debug(f"缓存命中: {cache_key}")
+                logger.debug("缓存命中: %s", cache_key)
                 return cached_value
-            
+
             # 执行函数
             result = await func(*args, **kwargs)
-            
+
             # 存入缓存
             cache.set(cache_key, result, ttl)
-            logger.debug(f"缓存存储: {cache_key}")
-            
+            logger.debug("缓存存储: %s", cache_key)
+
             return result
         return wrapper
     return decorator
 
 
+# 参数序列化后短于该长度时直接作为缓存键，不再计算摘要
+_RAW_KEY_MAX_LEN = 200
+
+# repr 结果稳定、可直接作为缓存键的参数类型
+_SCALAR_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
 def _generate_cache_key(func_name: str, prefix: str, args: tuple, kwargs: dict) -> str:
     """生成缓存键"""
-    key_parts = [prefix, func_name]
-    
-    # 添加参数
-    if args:
-        key_parts.extend(str(arg) for arg in args)
-    if kwargs:
-        key_parts.append(json.dumps(kwargs, sort_keys=True))
-    
-    key_str = ":".join(key_parts)
-    return hashlib.md5(key_str.encode()).hexdigest()
+    if all(type(v) in _SCALAR_TYPES for v in (*args, *kwargs.values())):
+        # 常见情况：参数都是标量，直接 repr 元组，无需 JSON 序列化
+        key_str = repr((args, tuple(sorted(kwargs.items()))))
+    else:
+        # 含容器或其他对象时用 orjson 序列化（无法序列化的对象退化为 repr）
+        key_str = orjson.dumps(
+            [args, sorted(kwargs.items())],
+            default=repr,
+            option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+    # 短参数直接使用原文（字典查找本身就会哈希），长参数用 xxh3 压缩为定长摘要
+    if len(key_str) >= _RAW_KEY_MAX_LEN:
+        key_str = xxhash.xxh3_64_hexdigest(key_str.encode())
+    return f"{prefix}:{func_name}:{key_str}"
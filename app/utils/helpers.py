@@ -3,6 +3,7 @@ from typing import Any, Dict, Optional
 from datetime import datetime
 import hashlib
 import json
+import xxhash
 
 
 def generate_id(prefix: str = "", length: int = 16) -> str:
@@ -13,8 +14,13 @@ def generate_id(prefix: str = "", length: int = 16) -> str:
 
 
 def hash_string(text: str) -> str:
-    """生成字符串哈希"""
-    return hashlib.sha256(text.encode()).hexdigest()
+    """生成字符串哈希（BLAKE2b-256，密码学强度，比 SHA-256 更快）"""
+    return hashlib.blake2b(text.encode(), digest_size=32).hexdigest()
+
+
+def hash_string_fast(text: str) -> str:
+    """生成字符串哈希（xxh3-128，非密码学用途，如缓存键、去重）"""
+    return xxhash.xxh3_128_hexdigest(text.encode())
 
 
 def safe_json_loads(text: str, default: Any = None) -> Any:
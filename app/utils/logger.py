@@ -1,41 +1,70 @@
 """日志配置"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 import logging
+import queue
 import sys
 from pathlib import Path
 from app.core.config import settings
 
+# 后台日志线程：业务代码只把日志记录放入队列，由该线程写控制台和文件
+_listener: Optional[QueueListener] = None
+_listener_running = False
+
 
 def setup_logging():
-    """配置日志系统"""
-    
+    """配置日志系统（可重复调用，已配置时只确保后台线程在运行）"""
+    global _listener, _listener_running
+
+    if _listener is None:
+        _listener = _configure()
+        _listener.start()
+        _listener_running = True
+        logging.getLogger(__name__).info("日志系统初始化完成")
+    elif not _listener_running:
+        _listener.start()
+        _listener_running = True
+
+
+def shutdown_logging():
+    """停止后台日志线程，写出队列中剩余的日志（应用关闭时调用）"""
+    global _listener_running
+
+    if _listener is not None and _listener_running:
+        _listener.stop()
+        _listener_running = False
+
+
+def _configure() -> QueueListener:
+    """配置根日志，返回尚未启动的 QueueListener"""
+
     # 创建日志目录
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
-    
+
     # 日志格式
     log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
-    
-    # 根日志配置
-    logging.basicConfig(
-        level=getattr(logging, settings.LOG_LEVEL.upper()),
-        format=log_format,
-        datefmt=date_format,
-        handlers=[
-            # 控制台输出
-            logging.StreamHandler(sys.stdout),
-            # 文件输出
-            logging.FileHandler(
-                log_dir / "app.log",
-                encoding="utf-8"
-            )
-        ]
-    )
-    
+    formatter = logging.Formatter(log_format, datefmt=date_format)
+
+    # 实际输出的 handler（格式化在后台线程中完成）
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+    file_handler = logging.FileHandler(log_dir / "app.log", encoding="utf-8")
+    file_handler.setFormatter(formatter)
+
+    # 根日志只挂 QueueHandler，记录日志时不再阻塞在磁盘写入上。
+    # QueueHandler 不设置格式，否则消息会在入队时被格式化一次、输出时再格式化一次
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
+    root.addHandler(QueueHandler(log_queue))
+
     # 设置第三方库日志级别
     logging.getLogger("uvicorn").setLevel(logging.INFO)
     logging.getLogger("fastapi").setLevel(logging.INFO)
     logging.getLogger("anthropic").setLevel(logging.WARNING)
-    
-    logger = logging.getLogger(__name__)
-    logger.info("日志系统初始化完成")
+
+    return QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
@@ -1,62 +1,108 @@
 """限流工具"""
-from typing import Dict
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import List, Tuple
 import logging
+import threading
+import time
+
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 分片数量：按 key 哈希到不同分片，避免全局锁竞争
+_NUM_SHARDS = 16
+
 
 class RateLimiter:
-    """简单的限流器（基于内存，生产环境建议使用 Redis）"""
-    
+    """令牌桶限流器（基于内存，多 worker 部署请使用 Redis 后端）
+
+    每个 key 只保存 (令牌数, 上次补充时间) 两个浮点数，
+    判断是否放行只需 O(1) 的浮点运算，无需扫描请求记录。
+    """
+
     def __init__(self, max_requests: int = 100, window_seconds: int = 60):
         """
         Args:
-            max_requests: 时间窗口内最大请求数
+            max_requests: 时间窗口内最大请求数（即桶容量）
             window_seconds: 时间窗口（秒）
         """
         self.max_requests = max_requests
-        self.window = timedelta(seconds=window_seconds)
-        self._requests: Dict[str, list] = {}
-    
+        self.window_seconds = window_seconds
+        self.capacity = float(max_requests)
+        # 每秒补充的令牌数
+        self.rate = max_requests / window_seconds
+        # 每个分片按最后访问时间排序：最久未访问的 key 在最前
+        self._shards: List["OrderedDict[str, Tuple[float, float]]"] = [
+            OrderedDict() for _ in range(_NUM_SHARDS)
+        ]
+        self._locks = [threading.Lock() for _ in range(_NUM_SHARDS)]
+
+    def _shard(self, key: str) -> int:
+        """获取 key 所在分片"""
+        return hash(key) % _NUM_SHARDS
+
+    def _refill(
+        self, buckets: "OrderedDict[str, Tuple[float, float]]", key: str, now: float
+    ) -> float:
+        """按流逝时间补充令牌，返回当前令牌数"""
+        bucket = buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        tokens, last_refill = bucket
+        return min(self.capacity, tokens + (now - last_refill) * self.rate)
+
+    def _store(
+        self,
+        buckets: "OrderedDict[str, Tuple[float, float]]",
+        key: str,
+        tokens: float,
+        now: float
+    ):
+        """保存令牌桶状态，并清理空闲的 key
+
+        空闲超过一个时间窗口的桶必然已补满，与不存在等价，可直接删除；
+        只需从最前面开始删除，遇到未空闲的即可停止，摊还 O(过期数)
+        """
+        buckets[key] = (tokens, now)
+        buckets.move_to_end(key)
+        cutoff = now - self.window_seconds
+        while buckets:
+            oldest_key, (_, last_refill) = next(iter(buckets.items()))
+            if last_refill > cutoff:
+                break
+            del buckets[oldest_key]
+
     def is_allowed(self, key: str) -> bool:
         """检查是否允许请求"""
-        now = datetime.now()
-        
-        # 初始化或清理过期记录
-        if key not in self._requests:
-            self._requests[key] = []
-        
-        # 移除过期的请求记录
-        cutoff_time = now - self.window
-        self._requests[key] = [
-            req_time for req_time in self._requests[key]
-            if req_time > cutoff_time
-        ]
-        
-        # 检查是否超过限制
-        if len(self._requests[key]) >= self.max_requests:
-            logger.warning(f"限流触发: {key}")
-            return False
-        
-        # 记录本次请求
-        self._requests[key].append(now)
-        return True
-    
-    def get_remaining(self, key: str) -> int:
+        return self.check_and_remaining(key)[0]
+
+    def check_and_remaining(self, key: str) -> Tuple[bool, int]:
+        """检查是否允许请求，并返回剩余请求次数（一次加锁、一次查找）"""
+        idx = self._shard(key)
+        buckets = self._shards[idx]
+        now = time.monotonic()
+
+        with self._locks[idx]:
+            tokens = self._refill(buckets, key, now)
+            if tokens < 1:
+                self._store(buckets, key, tokens, now)
+                logger.warning("限流触发: %s", key)
+                return False, 0
+
+            tokens -= 1
+            self._store(buckets, key, tokens, now)
+            return True, int(tokens)
+
+    def remaining(self, key: str) -> int:
         """获取剩余请求次数"""
-        if key not in self._requests:
-            return self.max_requests
-        
-        now = datetime.now()
-        cutoff_time = now - self.window
-        valid_requests = [
-            req_time for req_time in self._requests[key]
-            if req_time > cutoff_time
-        ]
-        
-        return max(0, self.max_requests - len(valid_requests))
+        idx = self._shard(key)
+        buckets = self._shards[idx]
+        with self._locks[idx]:
+            return int(self._refill(buckets, key, time.monotonic()))
 
 
 # 全局限流器实例
-rate_limiter = RateLimiter(max_requests=100, window_seconds=60)
+rate_limiter = RateLimiter(
+    max_requests=settings.RATE_LIMIT_REQUESTS,
+    window_seconds=settings.RATE_LIMIT_WINDOW
+)
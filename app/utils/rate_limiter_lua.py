@@ -0,0 +1,83 @@
+"""基于 Redis Lua 脚本的分布式限流"""
+from typing import Tuple
+import logging
+import time
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶限流脚本：每个 key 只保存 {令牌数, 上次补充时间} 两个字段，
+# 补充、扣减、写回在服务端原子执行，一次往返同时返回 {是否允许, 剩余次数}。
+# 空闲超过一个时间窗口的桶必然已补满，直接过期删除即可
+TOKEN_BUCKET_SCRIPT = """
+local k = KEYS[1]
+local now = tonumber(ARGV[1])
+local cap = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local b = redis.call('HMGET', k, 't', 'ts')
+local tokens = tonumber(b[1])
+local ts = tonumber(b[2])
+if tokens == nil or ts == nil then
+    tokens = cap
+    ts = now
+end
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', k, 't', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', k, ttl)
+return {allowed, math.floor(tokens)}
+"""
+
+
+class RedisRateLimiter:
+    """Redis 令牌桶限流器（多 worker 共享计数）"""
+
+    def __init__(self, max_requests: int = 100, window_seconds: int = 60):
+        """
+        Args:
+            max_requests: 时间窗口内最大请求数（即桶容量）
+            window_seconds: 时间窗口（秒）
+        """
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        # from_url 不会立即建立连接，首次调用时才连接。
+        # 设置较短的超时，Redis 不可达时尽快抛出 RedisError，由中间件降级为内存限流
+        self._redis = redis.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+        # 脚本只注册一次，之后通过 EVALSHA 调用
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+        # 每毫秒补充的令牌数
+        self._rate_per_ms = repr(max_requests / (window_seconds * 1000))
+        self._ttl_ms = window_seconds * 1000
+
+    async def check_and_remaining(self, key: str) -> Tuple[bool, int]:
+        """检查是否允许请求，并返回剩余请求次数（单次往返）"""
+        now_ms = int(time.time() * 1000)
+        allowed, remaining = await self._script(
+            keys=[f"rl:{key}"],
+            args=[now_ms, self.max_requests, self._rate_per_ms, self._ttl_ms]
+        )
+        return bool(allowed), int(remaining)
+
+    async def close(self):
+        """关闭 Redis 连接"""
+        await self._redis.aclose()
+
+
+# 全局 Redis 限流器实例
+redis_rate_limiter = RedisRateLimiter(
+    max_requests=settings.RATE_LIMIT_REQUESTS,
+    window_seconds=settings.RATE_LIMIT_WINDOW
+)
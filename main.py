@@ -9,7 +9,12 @@ import time
 from app.routes import search, chat
 from app.core.config import settings
 from app.core.database import init_db, close_db
-from app.utils.logger import setup_logging
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.services.chat_writer import chat_writer
+from app.services.copilot_client import get_copilot
+from app.services.session_manager import get_session_manager
+from app.utils.rate_limiter_lua import redis_rate_limiter
+from app.utils.logger import setup_logging, shutdown_logging
 from app.utils.exceptions import AIEcommerceException
 
 # 配置日志
@@ -20,23 +25,33 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    # 启动
+    # 启动（生命周期可能多次进入，如测试中，确保后台日志线程在运行）
+    setup_logging()
     logger.info("🚀 AI E-commerce Bot 启动中...")
     try:
-        init_db()
+        await init_db()
         
         # 启动会话清理任务
-        from app.services.session_manager import SessionManager
-        session_manager = SessionManager()
-        session_manager.start_cleanup_task()
-        
-        logger.info(f"📝 API 文档: http://{settings.HOST}:{settings.PORT}/docs")
-        logger.info(f"🌍 环境: {settings.ENVIRONMENT}")
+        get_session_manager().start_cleanup_task()
+
+        # 启动聊天历史批量写入任务
+        chat_writer.start()
+
+        # 创建（或在上次关闭后重新创建）LLM 的 HTTP 连接池
+        get_copilot().start()
+
+        logger.info("📝 API 文档: http://%s:%s/docs", settings.HOST, settings.PORT)
+        logger.info("🌍 环境: %s", settings.ENVIRONMENT)
         yield
     finally:
         # 关闭
         logger.info("👋 AI E-commerce Bot 关闭中...")
-        close_db()
+        await chat_writer.stop()
+        await close_db()
+        await get_copilot().close()
+        await redis_rate_limiter.close()
+        # 最后停止日志线程，写出队列中剩余的日志
+        shutdown_logging()
 
 
 app = FastAPI(
@@ -48,6 +63,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 限流（先注册，位于 CORS 内层，429 响应同样带有 CORS 头）
+app.add_middleware(RateLimitMiddleware)
+
 # CORS 配置
 app.add_middleware(
     CORSMiddleware,
@@ -62,17 +80,17 @@ app.add_middleware(
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """记录请求日志"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     # 处理请求
     response = await call_next(request)
     
     # 计算耗时
-    process_time = time.time() - start_time
+    process_time = time.perf_counter() - start_time
     
     logger.info(
-        f"{request.method} {request.url.path} "
-        f"- {response.status_code} - {process_time:.3f}s"
+        "%s %s - %d - %.3fs",
+        request.method, request.url.path, response.status_code, process_time
     )
     
     # 添加响应头
@@ -111,7 +129,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """通用异常处理"""
-    logger.error(f"未处理的异常: {exc}", exc_info=True)
+    logger.error("未处理的异常: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
@@ -7,7 +7,7 @@ echo "==============="
 # 激活虚拟环境
 source .venv/bin/activate
 
-# 运行测试
+# 运行测试（多核并行可追加：-n auto --dist=loadscope）
 pytest tests/ -v --cov=app --cov-report=html --cov-report=term
 
 echo ""
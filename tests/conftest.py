@@ -0,0 +1,170 @@
+"""测试公共 fixture"""
+import os
+
+# 测试使用内存数据库，需在导入应用（读取配置）之前设置；
+# 所有请求来自同一个客户端 IP，关闭限流以免用例数量触发 429（限流测试中单独开启）；
+# LLM 调用默认被模拟，没有真实 API Key 时使用占位值
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+
+from functools import lru_cache
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import pytest_asyncio
+from anthropic.resources import AsyncMessages
+from pytest_asyncio import is_async_test
+
+from app.services.intent_classifier import IntentClassifier
+from app.services.session_manager import SessionManager, get_session_manager
+
+
+# 模拟 LLM 的固定回复
+FAKE_REPLY = "您好，这是测试回复。"
+
+
+@lru_cache(maxsize=1)
+def get_app():
+    """获取应用实例：main 只在首次调用时导入，路由只注册一次，所有 fixture 共用"""
+    from main import app
+    return app
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-integration",
+        action="store_true",
+        default=False,
+        help="运行需要真实 LLM 服务的集成测试（同时关闭 LLM 模拟）"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """所有异步测试共用一个会话级事件循环，与会话级异步 fixture 所在的循环一致；
+    未指定 --run-integration 时跳过集成测试"""
+    session_loop = pytest.mark.asyncio(scope="session")
+    skip_integration = pytest.mark.skip(reason="需要 --run-integration 才会运行")
+    run_integration = config.getoption("--run-integration")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
+        if not run_integration and "integration" in item.keywords:
+            item.add_marker(skip_integration)
+
+
+async def _fake_create(self, **kwargs):
+    """模拟 messages.create，返回固定回复"""
+    return SimpleNamespace(content=[SimpleNamespace(text=FAKE_REPLY)])
+
+
+class _FakeStream:
+    """模拟 messages.stream 返回的流式响应"""
+
+    def __init__(self):
+        self.text_stream = self._chunks()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def _chunks(self):
+        for char in FAKE_REPLY:
+            yield char
+
+
+def _fake_stream(self, **kwargs):
+    """模拟 messages.stream"""
+    return _FakeStream()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def mock_llm(request):
+    """
+    模拟 LLM 调用，测试不依赖网络和真实 API
+
+    必须是会话级：会话级 fixture（如 aclient）先于函数级 fixture 创建，
+    函数级的模拟来不及生效。替换的是 AsyncMessages 类上的方法，
+    应用重新启动后新建的 API 客户端同样生效。指定 --run-integration 时不模拟
+    """
+    if request.config.getoption("--run-integration"):
+        yield
+        return
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(AsyncMessages, "create", _fake_create)
+        mp.setattr(AsyncMessages, "stream", _fake_stream)
+        yield
+
+
+@pytest_asyncio.fixture(scope="session")
+async def aclient(manager):
+    """
+    整个测试会话共用一个 AsyncClient
+
+    直接通过 ASGITransport 调用应用，没有 TestClient 的线程/事件循环桥接；
+    ASGITransport 不会触发 lifespan，这里手动执行一次应用启动/关闭。
+    接口使用测试自己的会话管理器，与应用默认实例隔离
+    """
+    app = get_app()
+    app.dependency_overrides[get_session_manager] = lambda: manager
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                yield c
+    finally:
+        app.dependency_overrides.pop(get_session_manager, None)
+
+
+@pytest_asyncio.fixture(scope="session", autouse=True)
+async def warmup(aclient):
+    """
+    测试开始前预热一次应用
+
+    首个请求需要承担的一次性开销（中间件和路由首次调用、请求体的 Pydantic 校验、
+    搜索接口的首次执行）在这里完成，不计入第一个测试
+    """
+    await aclient.get("/health")
+    await aclient.post("/api/v1/search", json={"query": "warm"})
+
+
+class FakeClock:
+    """可手动拨动的时钟，替代 time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def fake_clock():
+    """可手动拨动的时钟（由各测试替换到被测模块的 time.monotonic 上）"""
+    return FakeClock()
+
+
+@pytest.fixture(scope="session")
+def fastapi_app():
+    """应用实例（同步测试中配合 TestClient 使用，如 WebSocket）"""
+    return get_app()
+
+
+@pytest.fixture(scope="session")
+def classifier():
+    """整个测试会话共用的意图分类器（构造时编译正则和关键词自动机）"""
+    return IntentClassifier()
+
+
+@pytest.fixture(scope="session")
+def manager():
+    """
+    整个测试会话共用的会话管理器（纯内存，不依赖 Redis 或数据库）
+
+    使用 pytest-xdist 并行时每个 worker 是独立进程，各自持有一个实例，互不干扰
+    """
+    return SessionManager()
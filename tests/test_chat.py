@@ -1,222 +1,471 @@
 """聊天接口测试"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import orjson
 import pytest
 from fastapi.testclient import TestClient
-from main import app
+from redis.exceptions import TimeoutError as RedisTimeoutError
 
-client = TestClient(app)
+import app.middleware.rate_limit as rate_limit_middleware
+import app.routes.chat as chat_routes
+import app.services.session_manager as session_manager_module
+from app.core.config import settings
+from app.services.copilot_client import CopilotClient, get_copilot
+from app.services.session_manager import SessionManager, get_session_manager
+from app.services.search_service import SearchService, _NgramIndex
+from app.utils.rate_limiter import RateLimiter
 
 
+@pytest.mark.asyncio
 class TestChatAPI:
     """聊天接口测试"""
 
-    def test_health_check(self):
+    async def test_health_check(self, aclient):
         """测试健康检查"""
-        response = client.get("/health")
+        response = await aclient.get("/health")
         assert response.status_code == 200
-        assert response.json()["status"] == "healthy"
+        assert orjson.loads(response.content)["status"] == "healthy"
 
-    def test_chat_without_session(self):
+    async def test_chat_without_session(self, aclient):
         """测试无会话聊天"""
-        response = client.post(
+        response = await aclient.post(
             "/api/v1/chat",
             json={"message": "你好"}
         )
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "session_id" in data
         assert "message" in data
 
-    def test_chat_with_session(self):
-        """测试带会话聊天"""
-        # 第一次请求
-        response1 = client.post(
+    async def test_concurrent_chats(self, aclient):
+        """测试并发的独立对话（在同一事件循环上并发执行）"""
+        messages = ["你好", "我想买手机", "这个多少钱？", "有什么推荐吗？"]
+        responses = await asyncio.gather(*(
+            aclient.post("/api/v1/chat", json={"message": message})
+            for message in messages
+        ))
+        assert all(r.status_code == 200 for r in responses)
+        session_ids = {orjson.loads(r.content)["session_id"] for r in responses}
+        assert len(session_ids) == len(messages)
+
+    async def test_session_lifecycle(self, aclient):
+        """测试会话完整流程：创建 → 继续对话 → 获取历史 → 清除"""
+        # 创建会话
+        response = await aclient.post(
             "/api/v1/chat",
             json={"message": "我想买手机"}
         )
-        data1 = response1.json()
-        session_id = data1["session_id"]
+        assert response.status_code == 200
+        session_id = orjson.loads(response.content)["session_id"]
 
-        # 第二次请求，使用相同会话
-        response2 = client.post(
+        # 继续对话，使用相同会话
+        response = await aclient.post(
             "/api/v1/chat",
             json={
                 "session_id": session_id,
                 "message": "有什么推荐吗？"
             }
         )
-        data2 = response2.json()
-        assert data2["session_id"] == session_id
-
-    def test_get_chat_history(self):
-        """测试获取聊天历史"""
-        # 先创建一个会话
-        response1 = client.post(
-            "/api/v1/chat",
-            json={"message": "测试消息"}
-        )
-        session_id = response1.json()["session_id"]
+        assert response.status_code == 200
+        assert orjson.loads(response.content)["session_id"] == session_id
 
-        # 获取历史
-        response2 = client.get(f"/api/v1/chat/history/{session_id}")
-        assert response2.status_code == 200
-        history = response2.json()["history"]
-        assert len(history) > 0
+        # 获取历史（两轮对话）
+        response = await aclient.get(f"/api/v1/chat/history/{session_id}")
+        assert response.status_code == 200
+        assert len(orjson.loads(response.content)["history"]) == 4
 
-    def test_clear_session(self):
-        """测试清除会话"""
-        # 创建会话
-        response1 = client.post(
+        # 清除会话，响应中给出清除后的状态
+        response = await aclient.delete(f"/api/v1/chat/session/{session_id}")
+        assert response.status_code == 200
+        data = orjson.loads(response.content)
+        assert data["session_id"] == session_id
+        assert data["cleared"] is True
+        assert data["history"] == []
+
+    async def test_cleared_session_history(self, aclient):
+        """测试清除后的会话不能再获取历史，重复清除返回错误"""
+        response = await aclient.post(
             "/api/v1/chat",
-            json={"message": "测试"}
+            json={"message": "你好"}
         )
-        session_id = response1.json()["session_id"]
+        session_id = orjson.loads(response.content)["session_id"]
 
-        # 清除会话
-        response2 = client.delete(f"/api/v1/chat/session/{session_id}")
-        assert response2.status_code == 200
+        response = await aclient.delete(f"/api/v1/chat/session/{session_id}")
+        assert response.status_code == 200
 
-        # 尝试获取已清除的会话（应该返回 404 或创建新会话）
-        response3 = client.get(f"/api/v1/chat/history/{session_id}")
         # 会话不存在时应该返回错误
-        assert response3.status_code in [404, 400]
+        response = await aclient.get(f"/api/v1/chat/history/{session_id}")
+        assert response.status_code in [404, 400]
+        response = await aclient.delete(f"/api/v1/chat/session/{session_id}")
+        assert response.status_code in [404, 400]
+
+
+async def _stream(clock, steps):
+    """模拟流式输出：steps 为 (距上一片段的秒数, 片段)"""
+    for elapsed, chunk in steps:
+        clock.now += elapsed
+        yield chunk
+
+
+@pytest.mark.asyncio
+class TestBatchChunks:
+    """流式片段合并测试"""
+
+    @pytest.fixture(autouse=True)
+    def clock(self, monkeypatch, fake_clock):
+        monkeypatch.setattr(chat_routes, "time", SimpleNamespace(monotonic=fake_clock))
+        monkeypatch.setattr(chat_routes, "STREAM_FLUSH_CHARS", 4)
+        return fake_clock
+
+    async def _collect(self, clock, steps):
+        return [chunk async for chunk in chat_routes.batch_chunks(_stream(clock, steps))]
+
+    async def test_size_flush(self, clock):
+        """测试累计字符数达到阈值时发送"""
+        steps = [(0, "ab"), (0, "cd"), (0, "ef")]
+        assert await self._collect(clock, steps) == ["abcd", "ef"]
+
+    async def test_interval_flush(self, clock):
+        """测试距上次发送超过时间间隔时发送"""
+        steps = [(0, "a"), (0.015, "b"), (0.015, "c"), (0, "d")]
+        assert await self._collect(clock, steps) == ["abc", "d"]
+
+    async def test_tail_flush(self, clock):
+        """测试流结束时发送剩余片段，空流不发送"""
+        assert await self._collect(clock, [(0, "a"), (0, "b")]) == ["ab"]
+        assert await self._collect(clock, []) == []
 
 
+class TestWebSocketChat:
+    """WebSocket 聊天测试（TestClient 在独立线程的事件循环中运行应用）"""
+
+    def test_round_trip(self, fastapi_app, monkeypatch):
+        """测试一轮对话：意图 → 流式片段 → 完成，并记录用户消息和助手回复"""
+        manager = SessionManager()
+        monkeypatch.setitem(
+            fastapi_app.dependency_overrides, get_session_manager, lambda: manager
+        )
+        recorded = []
+        monkeypatch.setattr(
+            chat_routes.chat_writer, "enqueue",
+            lambda session_id, role, content, intent=None: recorded.append((role, content))
+        )
+
+        client = TestClient(fastapi_app)
+        with client.websocket_connect("/api/v1/chat/ws") as ws:
+            ws.send_text(orjson.dumps({"message": ""}).decode())
+            assert ws.receive_json() == {"error": "消息不能为空"}
+
+            ws.send_text(orjson.dumps({"message": "我想买手机"}).decode())
+            intent = ws.receive_json()
+            assert intent["type"] == "intent"
+            assert intent["intent"] == "search_product"
+
+            chunks = []
+            message = ws.receive_json()
+            while message["type"] == "message_chunk":
+                chunks.append(message["content"])
+                message = ws.receive_json()
+            assert message["type"] == "done"
+            session_id = message["session_id"]
+
+        reply = "".join(chunks)
+        assert reply
+        assert recorded == [("user", "我想买手机"), ("assistant", reply)]
+        response = client.get(f"/api/v1/chat/history/{session_id}")
+        history = orjson.loads(response.content)["history"]
+        assert [m["content"] for m in history] == ["我想买手机", reply]
+
+
+# 搜索请求用例
+BASIC_SEARCH = {"query": "手机"}
+FILTERED_SEARCH = {
+    "query": "手机",
+    "min_price": 1000,
+    "max_price": 5000,
+    "category": "电子产品"
+}
+PAGED_SEARCH = {"query": "手机", "page": 1, "page_size": 5}
+AI_SEARCH = {"query": "性价比高的智能手机", "use_ai": True}
+
+
+def check_basic_search(response):
+    """检查基础搜索结果"""
+    assert response.status_code == 200
+    data = orjson.loads(response.content)
+    assert "results" in data
+    assert "total" in data
+
+
+def check_filtered_search(response):
+    """检查带过滤的搜索结果"""
+    assert response.status_code == 200
+    data = orjson.loads(response.content)
+
+    # 验证价格过滤
+    for product in data["results"]:
+        assert 1000 <= product["price"] <= 5000
+
+
+def check_paged_search(response):
+    """检查分页结果"""
+    assert response.status_code == 200
+    data = orjson.loads(response.content)
+    assert data["page"] == 1
+    assert len(data["results"]) <= 5
+
+
+def check_ai_search(response):
+    """检查 AI 增强搜索结果"""
+    assert response.status_code == 200
+    data = orjson.loads(response.content)
+    # AI 增强搜索可能返回 insights
+    assert "ai_insights" in data or "results" in data
+
+
+@pytest.mark.asyncio
 class TestSearchAPI:
     """搜索接口测试"""
 
-    def test_basic_search(self):
+    async def test_basic_search(self, aclient):
         """测试基础搜索"""
-        response = client.post(
-            "/api/v1/search",
-            json={"query": "手机"}
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert "results" in data
-        assert "total" in data
+        response = await aclient.post("/api/v1/search", json=BASIC_SEARCH)
+        check_basic_search(response)
 
-    def test_search_with_filters(self):
+    async def test_search_with_filters(self, aclient):
         """测试带过滤的搜索"""
-        response = client.post(
-            "/api/v1/search",
-            json={
-                "query": "手机",
-                "min_price": 1000,
-                "max_price": 5000,
-                "category": "电子产品"
-            }
-        )
-        assert response.status_code == 200
-        data = response.json()
+        response = await aclient.post("/api/v1/search", json=FILTERED_SEARCH)
+        check_filtered_search(response)
 
-        # 验证价格过滤
-        for product in data["results"]:
-            assert 1000 <= product["price"] <= 5000
-
-    def test_search_pagination(self):
+    async def test_search_pagination(self, aclient):
         """测试分页"""
-        response = client.post(
-            "/api/v1/search",
-            json={
-                "query": "手机",
-                "page": 1,
-                "page_size": 5
-            }
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert data["page"] == 1
-        assert len(data["results"]) <= 5
+        response = await aclient.post("/api/v1/search", json=PAGED_SEARCH)
+        check_paged_search(response)
 
-    def test_ai_enhanced_search(self):
+    async def test_ai_enhanced_search(self, aclient):
         """测试 AI 增强搜索"""
-        response = client.post(
-            "/api/v1/search",
-            json={
-                "query": "性价比高的智能手机",
-                "use_ai": True
-            }
-        )
+        response = await aclient.post("/api/v1/search", json=AI_SEARCH)
+        check_ai_search(response)
+
+    async def test_search_matrix(self, aclient):
+        """测试多种搜索请求并发执行"""
+        basic, filtered, paged, ai = await asyncio.gather(*(
+            aclient.post("/api/v1/search", json=body)
+            for body in (BASIC_SEARCH, FILTERED_SEARCH, PAGED_SEARCH, AI_SEARCH)
+        ))
+        check_basic_search(basic)
+        check_filtered_search(filtered)
+        check_paged_search(paged)
+        check_ai_search(ai)
+
+    @pytest.mark.parametrize(
+        "url,check",
+        [
+            ("/api/v1/products/p001", lambda data: data["id"] == "p001"),
+            ("/api/v1/categories", lambda data: len(data["categories"]) > 0),
+            ("/api/v1/trending?limit=5", lambda data: 0 < len(data["products"]) <= 5),
+        ],
+        ids=["product", "categories", "trending"]
+    )
+    async def test_endpoint_shape(self, aclient, url, check):
+        """测试只读接口的返回结果（商品详情、分类、热门商品）"""
+        response = await aclient.get(url)
         assert response.status_code == 200
-        data = response.json()
-        # AI 增强搜索可能返回 insights
-        assert "ai_insights" in data or "results" in data
+        assert check(orjson.loads(response.content))
 
-    def test_get_product_detail(self):
-        """测试获取商品详情"""
-        response = client.get("/api/v1/products/p001")
-        assert response.status_code == 200
-        product = response.json()
-        assert product["id"] == "p001"
 
-    def test_get_categories(self):
-        """测试获取分类"""
-        response = client.get("/api/v1/categories")
-        assert response.status_code == 200
-        data = response.json()
-        assert "categories" in data
-        assert len(data["categories"]) > 0
+# 商品搜索关键词：单字、名称、描述、大小写、跨名称和描述、无匹配二元组
+SEARCH_QUERIES = ["a", "手", "iphone", "PRO", "芯片", "256gb apple", "qx", "手机"]
 
-    def test_get_trending_products(self):
-        """测试获取热门商品"""
-        response = client.get("/api/v1/trending?limit=5")
-        assert response.status_code == 200
-        data = response.json()
-        assert "products" in data
-        assert len(data["products"]) <= 5
 
+class TestNgramIndex:
+    """n-gram 倒排索引测试"""
 
-@pytest.mark.asyncio
-class TestIntentClassifier:
-    """意图分类器测试"""
+    @pytest.fixture
+    def index(self):
+        index = _NgramIndex()
+        index.add(0, "iphone 15")
+        index.add(0, "苹果手机")
+        index.add(1, "华为手机")
+        return index
 
-    async def test_search_intent(self):
-        """测试搜索意图"""
-        from app.services.intent_classifier import IntentClassifier
-        classifier = IntentClassifier()
+    def test_single_char(self, index):
+        """测试单字查询使用单字倒排表"""
+        assert index.candidates("手") == {0, 1}
+        assert index.candidates("p") == {0}
+        assert index.candidates("x") == set()
 
-        result = await classifier.classify("我想买手机")
-        assert result["intent"] == "search_product"
-        assert result["confidence"] > 0
+    def test_missing_bigram(self, index):
+        """测试两个字都出现、但二元组不存在时没有候选"""
+        assert index.candidates("ip") == {0}
+        assert index.candidates("pi") == set()
+
+    def test_no_match_across_texts(self, index):
+        """测试分别索引的两段文本，跨段的查询召回不到"""
+        assert index.candidates("15苹") == set()
+        assert index.candidates("苹果手机") == {0}
 
-    async def test_price_inquiry(self):
-        """测试价格询问"""
-        from app.services.intent_classifier import IntentClassifier
-        classifier = IntentClassifier()
 
-        result = await classifier.classify("这个多少钱？")
-        assert result["intent"] == "ask_price"
+@pytest.mark.asyncio
+class TestSearchService:
+    """商品搜索服务测试"""
+
+    @pytest.mark.parametrize("query", SEARCH_QUERIES)
+    @pytest.mark.parametrize("sort_by", ["relevance", "price_asc", "rating"])
+    async def test_matches_substring_scan(self, query, sort_by):
+        """测试倒排索引召回与逐个商品子串匹配的结果一致"""
+        service = SearchService()
+        q = query.lower()
+        expected = [
+            p for p in service._get_mock_products()
+            if q in p["name"].lower() or q in p["description"].lower()
+        ]
+        if sort_by == "price_asc":
+            expected.sort(key=lambda x: x["price"])
+        elif sort_by == "rating":
+            expected.sort(key=lambda x: x.get("rating", 0), reverse=True)
+
+        result = await service.search(query, sort_by=sort_by, page_size=100)
+        assert [p["id"] for p in result["products"]] == [p["id"] for p in expected]
+        assert result["total"] == len(expected)
+
+
+@pytest.fixture
+def small_rate_limit(monkeypatch):
+    """启用内存限流，并把额度调小为每分钟 3 次（使用独立的限流器，不影响其他测试）"""
+    monkeypatch.setattr(rate_limit_middleware, "rate_limiter", RateLimiter(3, 60))
+    monkeypatch.setattr(rate_limit_middleware, "_ENABLED", True)
+    monkeypatch.setattr(rate_limit_middleware, "_BACKEND", "memory")
+    monkeypatch.setattr(rate_limit_middleware, "_LIMIT", "3")
 
-    async def test_entity_extraction(self):
-        """测试实体提取"""
-        from app.services.intent_classifier import IntentClassifier
-        classifier = IntentClassifier()
 
-        result = await classifier.classify("我想要红色的iPhone")
+@pytest.mark.asyncio
+class TestRateLimitMiddleware:
+    """限流中间件测试"""
+
+    async def test_limit_exceeded(self, aclient, small_rate_limit):
+        """测试超出额度后返回 429，响应头带有剩余次数"""
+        headers = {"Origin": "http://example.com"}
+        for remaining in ("2", "1", "0"):
+            response = await aclient.get("/", headers=headers)
+            assert response.status_code == 200
+            assert response.headers["X-RateLimit-Remaining"] == remaining
+            assert response.headers["X-RateLimit-Limit"] == "3"
+
+        response = await aclient.get("/", headers=headers)
+        assert response.status_code == 429
+        assert orjson.loads(response.content) == {"detail": "请求过于频繁，请稍后再试"}
+        assert response.headers["X-RateLimit-Remaining"] == "0"
+        assert response.headers["X-RateLimit-Limit"] == "3"
+        # 限流位于 CORS 内层，429 响应同样带有 CORS 头
+        assert "access-control-allow-origin" in response.headers
+
+    async def test_skip_paths(self, aclient, small_rate_limit):
+        """测试健康检查不计入限流"""
+        for _ in range(5):
+            response = await aclient.get("/health")
+            assert response.status_code == 200
+            assert "X-RateLimit-Remaining" not in response.headers
+
+        response = await aclient.get("/")
+        assert response.headers["X-RateLimit-Remaining"] == "2"
+
+    async def test_redis_backend(self, aclient, small_rate_limit, monkeypatch):
+        """测试 Redis 后端：一次脚本调用同时得到是否放行和剩余次数"""
+        calls = []
+
+        async def fake_script(keys, args):
+            calls.append((keys, args))
+            return [1, 7]
+
+        limiter = rate_limit_middleware.redis_rate_limiter
+        monkeypatch.setattr(rate_limit_middleware, "_BACKEND", "redis")
+        monkeypatch.setattr(limiter, "_script", fake_script)
+
+        response = await aclient.get("/")
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Remaining"] == "7"
+        [(keys, args)] = calls
+        assert keys == ["rl:127.0.0.1"]
+        assert args[1:] == [limiter.max_requests, limiter._rate_per_ms, limiter._ttl_ms]
+
+    async def test_redis_error_falls_back(self, aclient, small_rate_limit, monkeypatch):
+        """测试 Redis 不可用时降级为内存限流"""
+        async def failing_script(keys, args):
+            raise RedisTimeoutError("Timeout connecting to server")
+
+        monkeypatch.setattr(rate_limit_middleware, "_BACKEND", "redis")
+        monkeypatch.setattr(rate_limit_middleware.redis_rate_limiter, "_script", failing_script)
+
+        for remaining in ("2", "1", "0"):
+            response = await aclient.get("/")
+            assert response.status_code == 200
+            assert response.headers["X-RateLimit-Remaining"] == remaining
+        response = await aclient.get("/")
+        assert response.status_code == 429
+
+    async def test_redis_timeouts(self):
+        """测试 Redis 客户端设置了连接/读写超时，不可达时能尽快降级"""
+        kwargs = rate_limit_middleware.redis_rate_limiter._redis.connection_pool.connection_kwargs
+        assert kwargs["socket_connect_timeout"] == settings.REDIS_SOCKET_CONNECT_TIMEOUT
+        assert kwargs["socket_timeout"] == settings.REDIS_SOCKET_TIMEOUT
+
+
+# 意图分类用例：(消息, 期望意图)，期望意图为 None 时检查实体提取
+CLASSIFY_CASES = [
+    ("我想买手机", "search_product"),
+    ("这个多少钱？", "ask_price"),
+    ("我想要红色的iPhone", None),
+]
+
+
+def check_classify(result, expected):
+    """检查意图分类结果"""
+    if expected is None:
         entities = result.get("entities", {})
         # 检查是否提取到颜色或产品名称
         assert "color" in entities or "product_name" in entities
+    else:
+        assert result["intent"] == expected
+        assert result["confidence"] > 0
+
+
+@pytest.mark.asyncio
+class TestIntentClassifier:
+    """意图分类器测试"""
+
+    @pytest.mark.parametrize(
+        "text,expected", CLASSIFY_CASES, ids=["search", "price", "entities"]
+    )
+    async def test_classify(self, classifier, text, expected):
+        """测试意图识别与实体提取"""
+        result = await classifier.classify(text)
+        check_classify(result, expected)
+
+    async def test_classify_gathered(self, classifier):
+        """测试并发分类多条消息"""
+        results = await asyncio.gather(*(
+            classifier.classify(text) for text, _ in CLASSIFY_CASES
+        ))
+        for result, (_, expected) in zip(results, CLASSIFY_CASES):
+            check_classify(result, expected)
 
 
 @pytest.mark.asyncio
 class TestSessionManager:
     """会话管理器测试"""
 
-    async def test_create_session(self):
+    async def test_create_session(self, manager):
         """测试创建会话"""
-        from app.services.session_manager import SessionManager
-        manager = SessionManager()
-
         session = await manager.create_session()
         assert "session_id" in session
         assert "created_at" in session
         assert "history" in session
 
-    async def test_get_session(self):
+    async def test_get_session(self, manager):
         """测试获取会话"""
-        from app.services.session_manager import SessionManager
-        manager = SessionManager()
-
         # 创建会话
         session = await manager.create_session()
         session_id = session["session_id"]
@@ -226,11 +475,8 @@ class TestSessionManager:
         assert retrieved is not None
         assert retrieved["session_id"] == session_id
 
-    async def test_add_message(self):
+    async def test_add_message(self, manager):
         """测试添加消息"""
-        from app.services.session_manager import SessionManager
-        manager = SessionManager()
-
         session = await manager.create_session()
         session_id = session["session_id"]
 
@@ -244,3 +490,145 @@ class TestSessionManager:
         # 验证消息已添加
         session = await manager.get_session(session_id)
         assert len(session["history"]) == 1
+
+    async def test_add_message_save_to_db(self, manager, monkeypatch):
+        """测试需要持久化的消息交给聊天历史写入器"""
+        recorded = []
+        monkeypatch.setattr(
+            session_manager_module.chat_writer, "enqueue",
+            lambda *args: recorded.append(args)
+        )
+        session_id = (await manager.create_session())["session_id"]
+
+        message = {"role": "user", "content": "测试消息", "intent": "greeting"}
+        assert await manager.add_message(session_id, message, save_to_db=True) is True
+        assert recorded == [(session_id, "user", "测试消息", "greeting")]
+
+    async def test_append_turn(self, manager):
+        """测试添加一轮对话"""
+        session = await manager.create_session()
+        session_id = session["session_id"]
+
+        success = await manager.append_turn(
+            session_id,
+            {"role": "user", "content": "你好"},
+            {"role": "assistant", "content": "你好，请问需要什么帮助？"}
+        )
+        assert success is True
+
+        session = await manager.get_session(session_id)
+        assert [m["role"] for m in session["history"]] == ["user", "assistant"]
+
+    @pytest.fixture
+    def session_clock(self, monkeypatch, fake_clock):
+        """固定会话管理器的单调时钟（消息时间戳仍使用真实时间）"""
+        monkeypatch.setattr(
+            session_manager_module, "time",
+            SimpleNamespace(monotonic=fake_clock, time=time.time)
+        )
+        return fake_clock
+
+    async def test_cleanup_expired_sessions(self, session_clock, monkeypatch):
+        """测试清理过期会话：访问过的会话保留，每个分片遇到未过期的会话即停止"""
+        manager = SessionManager()
+        manager.session_timeout = 60
+        sessions = [await manager.create_session() for _ in range(64)]
+        touched = {s["session_id"] for s in sessions[:32]}
+        expired = {s["session_id"] for s in sessions[32:]}
+
+        # 先创建的一半被访问过，移到各分片末尾，其余的排在前面
+        session_clock.now += 30
+        for session_id in touched:
+            assert await manager.get_session(session_id) is not None
+
+        checks = []
+        is_expired = manager._is_expired
+        monkeypatch.setattr(
+            manager, "_is_expired", lambda session: checks.append(1) or is_expired(session)
+        )
+
+        session_clock.now += 31
+        assert await manager.cleanup_expired_sessions() == len(expired)
+        remaining = {sid for shard in manager._shards for sid in shard}
+        assert remaining == touched
+        # 每删除一个检查一次，每个分片最多再多检查一个未过期的会话
+        assert len(checks) <= len(expired) + len(manager._shards)
+
+    async def test_get_active_sessions(self, session_clock):
+        """测试最近活跃会话的时间截止点"""
+        manager = SessionManager()
+        old = (await manager.create_session())["session_id"]
+        session_clock.now += 200
+        recent = (await manager.create_session())["session_id"]
+
+        # 5 分钟前正好是 old 的活动时间，不算活跃
+        session_clock.now += 100
+        assert manager.get_active_sessions(minutes=5) == [recent]
+
+        await manager.get_session(old)
+        assert set(manager.get_active_sessions(minutes=5)) == {old, recent}
+        assert manager.get_session_count() == 2
+
+
+# JSON 提取用例：(回复文本, 期望结果)
+EXTRACT_JSON_CASES = [
+    ('推荐如下：\n```json\n{"a": 1}\n```\n以上', {"a": 1}),
+    ('```\n{"a": 1}\n```', {"a": 1}),
+    ('结果：{"a": 1}，请参考', {"a": 1}),
+    ('{"text": "含有 } 和 { 的字符串"}', {"text": "含有 } 和 { 的字符串"}),
+    ('{"text": "他说 \\"你好}\\""}', {"text": '他说 "你好}"'}),
+    ('{不是 JSON} 然后 {"a": 1}', {"a": 1}),
+    ('[未闭合 {"a": 1}', {"a": 1}),
+    ('{"a": 1', None),
+    ("没有 JSON", None),
+]
+
+
+class TestCopilotClient:
+    """Copilot 客户端测试（不调用 LLM）"""
+
+    async def test_restart_after_close(self):
+        """测试关闭后再次启动会重建连接池（应用生命周期可能多次进入）"""
+        client = CopilotClient()
+        http_client = client.http_client
+        client.start()
+        assert client.http_client is http_client
+
+        await client.close()
+        assert http_client.is_closed
+
+        client.start()
+        assert not client.http_client.is_closed
+        assert client.http_client is not http_client
+        result = await client.chat("你好")
+        assert result["message"]
+        await client.close()
+
+    @pytest.mark.parametrize(
+        "text,expected",
+        EXTRACT_JSON_CASES,
+        ids=[
+            "fenced", "fenced-no-tag", "unfenced", "braces-in-string",
+            "escaped-quote", "bad-then-good", "unclosed-then-good",
+            "unclosed", "no-json",
+        ]
+    )
+    def test_extract_json(self, text, expected):
+        """测试从回复文本中提取 JSON"""
+        assert get_copilot()._extract_json(text) == expected
+
+    @pytest.mark.parametrize(
+        "text,expected",
+        [
+            ("{" * 100_000, None),
+            ('{"a": [' + ", ".join(map(str, range(20_000))), None),
+            ("[" * 100_000 + '{"a": 1}', {"a": 1}),
+        ],
+        ids=["open-braces", "truncated", "nested-then-good"]
+    )
+    def test_extract_json_unclosed_is_linear(self, text, expected):
+        """测试长文本括号未闭合（如回复被截断）时仍是单次扫描，不会退化为 O(n²)"""
+        start = time.perf_counter()
+        assert get_copilot()._extract_json(text) == expected
+        # 逐次回退重扫时需要数分钟，单次扫描远小于该上限
+        assert time.perf_counter() - start < 1.0
@@ -0,0 +1,153 @@
+"""工具模块测试"""
+from types import SimpleNamespace
+
+import pytest
+import xxhash
+
+import app.utils.cache as cache_module
+import app.utils.rate_limiter as rate_limiter_module
+from app.utils.cache import CacheManager, cached, _generate_cache_key
+from app.utils.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_clock):
+    """固定限流器和缓存使用的时间，测试结果不受运行速度影响"""
+    monkeypatch.setattr(rate_limiter_module, "time", SimpleNamespace(monotonic=fake_clock))
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=fake_clock))
+    return fake_clock
+
+
+def _same_shard_key(limiter: RateLimiter, key: str) -> str:
+    """找一个与 key 落在同一分片的其他 key"""
+    i = 0
+    while True:
+        other = f"{key}-{i}"
+        if limiter._shard(other) == limiter._shard(key):
+            return other
+        i += 1
+
+
+class TestRateLimiter:
+    """令牌桶限流器测试"""
+
+    def test_capacity(self, clock):
+        """测试桶容量用完后拒绝请求"""
+        limiter = RateLimiter(max_requests=3, window_seconds=60)
+        results = [limiter.check_and_remaining("ip") for _ in range(4)]
+        assert results == [(True, 2), (True, 1), (True, 0), (False, 0)]
+        assert limiter.is_allowed("ip") is False
+
+    def test_refill(self, clock):
+        """测试按流逝时间补充令牌"""
+        limiter = RateLimiter(max_requests=3, window_seconds=60)
+        for _ in range(3):
+            limiter.check_and_remaining("ip")
+
+        # 每 20 秒补充一个令牌
+        clock.now += 19
+        assert limiter.check_and_remaining("ip") == (False, 0)
+        clock.now += 1
+        assert limiter.check_and_remaining("ip") == (True, 0)
+
+        # 补充不超过桶容量
+        clock.now += 600
+        assert limiter.remaining("ip") == 3
+
+    def test_remaining(self, clock):
+        """测试查询剩余次数不消耗令牌"""
+        limiter = RateLimiter(max_requests=3, window_seconds=60)
+        assert limiter.remaining("ip") == 3
+        limiter.check_and_remaining("ip")
+        assert limiter.remaining("ip") == 2
+        assert limiter.remaining("ip") == 2
+
+    def test_idle_buckets_evicted(self, clock):
+        """测试空闲超过一个时间窗口的桶在同分片写入时被清理"""
+        limiter = RateLimiter(max_requests=3, window_seconds=60)
+        other = _same_shard_key(limiter, "idle")
+        buckets = limiter._shards[limiter._shard("idle")]
+
+        limiter.check_and_remaining("idle")
+
+        # 未满一个时间窗口，保留
+        clock.now += 30
+        limiter.check_and_remaining(other)
+        assert "idle" in buckets
+
+        # 空闲满一个时间窗口，清理；刚访问的 key 保留
+        clock.now += 30
+        limiter.check_and_remaining(other)
+        assert "idle" not in buckets
+        assert other in buckets
+
+        # 被清理的 key 再次访问时按满桶计算
+        assert limiter.remaining("idle") == 3
+
+
+class TestCacheManager:
+    """内存缓存测试"""
+
+    def test_lru_eviction(self, clock):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = CacheManager(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # 访问 a 后，b 成为最久未使用的条目
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl_expiry(self, clock):
+        """测试按单调时钟过期"""
+        cache = CacheManager()
+        cache.set("k", "v", ttl=10)
+        cache.set("forever", "v")
+
+        clock.now += 10
+        assert cache.get("k") == "v"
+        clock.now += 0.1
+        assert cache.get("k") is None
+        assert "k" not in cache._cache
+        # 未设置 ttl 的条目不过期
+        assert cache.get("forever") == "v"
+
+
+class TestCacheKey:
+    """缓存键生成测试"""
+
+    def test_scalar_args(self):
+        """测试标量参数直接 repr 作为缓存键"""
+        key = _generate_cache_key("f", "p", (1, "a"), {"b": 2})
+        assert key == "p:f:((1, 'a'), (('b', 2),))"
+
+    def test_container_args(self):
+        """测试含容器的参数使用 JSON 序列化"""
+        key = _generate_cache_key("f", "p", ([1, 2],), {"d": {"x": 1}})
+        assert key == 'p:f:[[[1,2]],[["d",{"x":1}]]]'
+
+    def test_long_args_hashed(self):
+        """测试过长的参数压缩为 xxh3 摘要"""
+        long_arg = "x" * 300
+        key = _generate_cache_key("f", "p", (long_arg,), {})
+        raw = repr(((long_arg,), ()))
+        assert key == f"p:f:{xxhash.xxh3_64_hexdigest(raw.encode())}"
+
+    async def test_cached_skips_self_and_excluded(self, monkeypatch):
+        """测试方法的 self 和 exclude 指定的参数不参与缓存键计算"""
+        monkeypatch.setattr(cache_module, "cache", CacheManager())
+        calls = []
+
+        class Service:
+            @cached(ttl=60, key_prefix="svc", exclude=("db",))
+            async def lookup(self, item_id, db=None):
+                calls.append(item_id)
+                return {"id": item_id}
+
+        assert await Service().lookup("p001", db=object()) == {"id": "p001"}
+        assert await Service().lookup("p001", db=object()) == {"id": "p001"}
+        assert calls == ["p001"]
+        await Service().lookup("p002")
+        assert calls == ["p001", "p002"]